@@ -0,0 +1,49 @@
+# Benchmark: storing uploaded files in the blob store (blob_store.py), new content vs content already stored,
+# next to persist_to (ingest.py), which writes every upload
+# Run it with: python bench_blob_store.py
+import os
+import shutil
+import tempfile
+import time
+
+from blob_store import BlobStore
+from ingest import persist_to
+from uploads import StreamedFile
+
+FILES = 200
+FILE_SIZE = 1024 * 1024
+
+
+def uploads(directory, contents):
+    files = []
+    for content in contents:
+        file = StreamedFile("file", "file.bin", None, directory)
+        file.write(content)
+        file.finish()
+        files.append(file)
+    return files
+
+
+def timed(label, step, files):
+    start = time.perf_counter()
+    for file in files:
+        step(file)
+    elapsed = time.perf_counter() - start
+    for file in files:
+        file.close()
+    print(f"{label:<22} {elapsed / len(files) * 1e3:>10.2f} {len(files) * FILE_SIZE / 2**20 / elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    contents = [os.urandom(FILE_SIZE) for _ in range(FILES)]
+    store = BlobStore(os.path.join(directory, "blobs"))
+    print(f"{FILES} x {FILE_SIZE // 2**20} MB")
+    print(f"{'mode':<22} {'ms/file':>10} {'MB/s':>8}")
+    timed("persist_to", persist_to(os.path.join(directory, "files")), uploads(directory, contents))
+    timed("blob store, new", store.put, uploads(directory, contents))
+    timed("blob store, duplicate", store.put, uploads(directory, contents))
+    stats = store.stats()
+    print(f"stored {stats['blobs']} blobs, {stats['bytes'] // 2**20} MB on disk for {stats['references']} uploads")
+    store.close()
+    shutil.rmtree(directory)
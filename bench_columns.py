@@ -0,0 +1,50 @@
+# Benchmark: price + tax aggregates over dicts of floats vs the NumPy price columns (columns.py)
+# Run it with: python bench_columns.py
+import random
+import statistics
+import time
+import tracemalloc
+
+from columns import PriceColumns
+
+ITEMS = 1_000_000
+TAGS = [f"tag{i}" for i in range(20)]
+
+
+def dict_summary(items):
+    totals = sorted(item["price"] + item["tax"] for item in items.values())
+    return {
+        "sum": sum(totals),
+        "avg": statistics.fmean(totals),
+        "p50": totals[len(totals) // 2],
+        "p99": totals[int(len(totals) * 0.99)],
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    rows = [(f"item{i}", round(random.uniform(1, 500), 2), random.choice((0.0, 10.5, 20.2)), random.sample(TAGS, 2)) for i in range(ITEMS)]
+
+    tracemalloc.start()
+    items = {key: {"price": price, "tax": tax} for key, price, tax, _ in rows}
+    dict_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    columns = PriceColumns()
+    for key, price, tax, tags in rows:
+        columns.set(key, price, tax, tags)
+    column_memory = columns.price.nbytes + columns.tax.nbytes
+
+    print(f"{ITEMS:,} items")
+    print(f"price/tax memory: dicts {dict_memory / 2**20:,.0f} MiB, columns {column_memory / 2**20:,.0f} MiB (arrays only)")
+    print(f"summary, dicts:        {timed(lambda: dict_summary(items)):>8.1f} ms")
+    print(f"summary, columns:      {timed(lambda: columns.summary()):>8.1f} ms")
+    print(f"summary by tag ({len(TAGS)}): {timed(lambda: columns.summary_by_tag()):>8.1f} ms")
+    updates = [(f"item{random.randrange(ITEMS)}", 42.0, 10.5, ["tag0"]) for _ in range(100_000)]
+    elapsed = timed(lambda: [columns.set(*update) for update in updates])
+    print(f"incremental update:    {elapsed / len(updates) * 1000:>8.2f} us per write")
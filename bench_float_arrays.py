@@ -0,0 +1,44 @@
+# Benchmark: reading and writing 300k weights as a JSON dict vs packed float arrays (float_arrays.py)
+# Run it with: python bench_float_arrays.py
+import json
+import time
+from typing import Dict
+
+import numpy as np
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+import float_arrays
+
+WEIGHTS = 300_000
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    weights = float_arrays.Weights(np.arange(WEIGHTS, dtype="<i8") * 7, rng.random(WEIGHTS))
+    json_body = json.dumps(weights.to_dict()).encode()
+    bodies = {
+        "octet-stream f64": float_arrays.encode(weights, float_arrays.DTYPES["float64"]),
+        "octet-stream f32": float_arrays.encode(weights, float_arrays.DTYPES["float32"]),
+        "npy f64": float_arrays.encode_npy(weights),
+    }
+
+    print(f"{WEIGHTS:,} int keys -> float weights")
+    print(f"{'format':<18} {'bytes':>10} {'decode ms':>10} {'encode ms':>10}")
+    decode_ms = timed(lambda: parse_obj_as(Dict[int, float], json.loads(json_body)))
+    encode_ms = timed(lambda: JSONResponse(weights.to_dict()))
+    print(f"{'json':<18} {len(json_body):>10,} {decode_ms:>10.1f} {encode_ms:>10.1f}")
+    for name, body in bodies.items():
+        decode = float_arrays.decode_npy if name.startswith("npy") else float_arrays.decode
+        encode = float_arrays.encode_npy if name.startswith("npy") else float_arrays.encode
+        dtype = float_arrays.DTYPES["float32" if name.endswith("f32") else "float64"]
+        print(f"{name:<18} {len(body):>10,} {timed(lambda: decode(body)):>10.3f} {timed(lambda: encode(weights, dtype)):>10.1f}")
@@ -0,0 +1,28 @@
+# Micro-benchmark: HS256Codec (hs256.py) vs python-jose, encode and decode throughput
+# Run it with: python bench_hs256.py
+import timeit
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from hs256 import HS256Codec
+from main_14 import ALGORITHM, SECRET_KEY
+
+N = 20_000
+
+
+def bench(label, fn):
+    seconds = min(timeit.repeat(fn, number=N, repeat=3))
+    print(f"{label:<14} {N / seconds:>12,.0f} ops/s  {seconds / N * 1e6:8.2f} us/op")
+
+
+if __name__ == "__main__":
+    codec = HS256Codec(SECRET_KEY)
+    claims = {"sub": "johndoe", "exp": datetime.utcnow() + timedelta(minutes=30)}
+    token = codec.encode(claims)
+    assert jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]) == codec.decode(token)
+
+    bench("jose encode", lambda: jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM))
+    bench("codec encode", lambda: codec.encode(claims))
+    bench("jose decode", lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]))
+    bench("codec decode", lambda: codec.decode(token))
@@ -0,0 +1,89 @@
+# Benchmark: one multipart upload of 100 x 10 MB files, files processed one after the other vs the
+# concurrent ingestion pipeline (ingest.py). Steps: SHA-256, content sniffing, persisting (fsync + rename)
+# Run it with: python bench_ingest.py
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from starlette.requests import Request
+
+from ingest import StreamedIngest, checksum, persist_to, sniff_content_type
+from uploads import StreamedForm, StreamedUploads
+
+FILES = 100
+FILE_SIZE = 10 * 1024 * 1024
+CHUNK = 64 * 1024
+BOUNDARY = b"benchboundary"
+
+
+def make_request():
+    block = os.urandom(CHUNK)
+    chunks = []
+    for i in range(FILES):
+        chunks.append(
+            b"\r\n" * bool(i) + b"--" + BOUNDARY + b"\r\n"
+            + f'Content-Disposition: form-data; name="files"; filename="file{i}.bin"\r\n'.encode()
+            + b"Content-Type: application/octet-stream\r\n\r\n"
+        )
+        chunks.extend([block] * (FILE_SIZE // CHUNK))
+    chunks.append(b"\r\n--" + BOUNDARY + b"--\r\n")
+    position = 0
+
+    async def receive():
+        nonlocal position
+        position += 1
+        return {"type": "http.request", "body": chunks[position - 1], "more_body": position < len(chunks)}
+
+    scope = {"type": "http", "method": "POST", "path": "/files/", "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)]}
+    return Request(scope, receive)
+
+
+async def sequential(directory):
+    # Everything received (and hashed) first, then the files handled one at a time
+    form = StreamedForm()
+    await StreamedUploads(max_file_size=FILE_SIZE, directory=directory).parse(make_request(), form)
+    persist = persist_to(os.path.join(directory, "files"))
+    results = []
+    for file in form.all_files():
+        result = {"size": file.size, "sha256": file.sha256}
+        result.update(sniff_content_type(file))
+        result.update(persist(file))
+        results.append(result)
+    form.close()
+    return results
+
+
+async def concurrent(directory, max_concurrency):
+    ingest = StreamedIngest(
+        StreamedUploads(max_file_size=FILE_SIZE, directory=directory, hash=False),
+        steps=[checksum, sniff_content_type, persist_to(os.path.join(directory, "files"))],
+        max_concurrency=max_concurrency,
+    )
+    dependency = ingest(make_request())
+    upload = await dependency.__anext__()
+    results = upload.results
+    await dependency.aclose()
+    return results
+
+
+async def main():
+    print(f"{FILES} x {FILE_SIZE // 2**20} MB, {os.cpu_count()} CPUs")
+    print(f"{'mode':<16} {'seconds':>8} {'MB/s':>8}")
+    for label, run in [
+        ("sequential", sequential),
+        ("concurrent x4", lambda directory: concurrent(directory, 4)),
+        ("concurrent x8", lambda directory: concurrent(directory, 8)),
+    ]:
+        directory = tempfile.mkdtemp()
+        start = time.perf_counter()
+        results = await run(directory)
+        elapsed = time.perf_counter() - start
+        assert len(results) == FILES and all(result["size"] == FILE_SIZE for result in results)
+        print(f"{label:<16} {elapsed:>8.2f} {FILES * FILE_SIZE / 2**20 / elapsed:>8.0f}")
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+# Benchmark: read-modify-write throughput under contention, one global lock vs striped per-key locks (locks.py)
+# Run it with: python bench_locks.py
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+
+from locks import KeyedLocks
+
+TASKS = 200
+UPDATES = 4_000
+WRITE_LATENCY = 0.001  # The await inside the critical section, e.g. the store's commit
+
+
+class GlobalLock:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def hold(self, key):
+        async with self.lock:
+            yield
+
+
+async def run(locks, distinct_keys):
+    counters = {key: 0 for key in range(distinct_keys)}
+    keys = [random.randrange(distinct_keys) for _ in range(UPDATES)]
+
+    async def worker(n):
+        for key in keys[n::TASKS]:
+            async with locks.hold(key):
+                value = counters[key]
+                await asyncio.sleep(WRITE_LATENCY)
+                counters[key] = value + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(TASKS)))
+    elapsed = time.perf_counter() - start
+    assert sum(counters.values()) == UPDATES  # No lost updates
+    return UPDATES / elapsed
+
+
+async def main():
+    print(f"{'keys':>6} {'global/s':>9} {'striped/s':>10}")
+    for distinct_keys in (1, 4, 16, 64, 256, 1024):
+        global_rate = await run(GlobalLock(), distinct_keys)
+        striped_rate = await run(KeyedLocks(stripes=64), distinct_keys)
+        print(f"{distinct_keys:>6} {global_rate:>9,.0f} {striped_rate:>10,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
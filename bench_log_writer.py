@@ -0,0 +1,60 @@
+# Benchmark: writes/s of background-task logging, open + append + close per message (what main_17.write_log
+# did, in the threadpool like BackgroundTasks runs it) vs BatchedLogWriter (log_writer.py) with each fsync policy
+# Run it with: python bench_log_writer.py
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from log_writer import BatchedLogWriter
+
+N = 20_000
+MESSAGE = "message to someone@example.com\n"
+
+
+def write_log(path, message):
+    with open(path, mode="a") as log:
+        log.write(message)
+
+
+async def open_per_call(path):
+    for _ in range(N):
+        await run_in_threadpool(write_log, path, MESSAGE)
+
+
+def batched(**options):
+    async def run(path):
+        writer = BatchedLogWriter(path, **options)
+        for _ in range(N):
+            await writer.write(MESSAGE)
+        await writer.flush()
+        writer.close()
+
+    return run
+
+
+async def main():
+    print(f"{N} messages")
+    print(f"{'mode':<28} {'writes/s':>10}")
+    for label, run in [
+        ("open per call", open_per_call),
+        ("batched, fsync=never", batched(fsync="never")),
+        ("batched, fsync=interval", batched(fsync="interval")),
+        ("batched, fsync=batch", batched(fsync="batch")),
+    ]:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "log.txt")
+        start = time.perf_counter()
+        await run(path)
+        elapsed = time.perf_counter() - start
+        with open(path) as log:
+            assert sum(1 for _ in log) == N
+        print(f"{label:<28} {N / elapsed:>10.0f}")
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
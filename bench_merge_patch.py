@@ -0,0 +1,29 @@
+# Benchmark: cost of a one field PATCH, rebuild-the-model vs MergePatcher (merge_patch.py), for growing items
+# Run it with: python bench_merge_patch.py
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+
+from main_10 import Item
+from merge_patch import MergePatcher
+
+N = 200
+
+
+def rebuild_patch(stored_item_data, patch):
+    # What main_10's PATCH used to do
+    stored_item_model = Item(**stored_item_data)
+    update_data = Item(**patch).dict(exclude_unset=True)
+    updated_item = stored_item_model.copy(update=update_data)
+    return jsonable_encoder(updated_item)
+
+
+if __name__ == "__main__":
+    patcher = MergePatcher(Item)
+    print(f"{'tags':>8} {'patch':>12} {'rebuild us':>11} {'merge us':>9}")
+    for tag_count in (10, 1_000, 10_000):
+        stored = jsonable_encoder(Item(name="Foo", price=50.2, tags=[f"tag{i}" for i in range(tag_count)]))
+        for label, patch in (("price", {"price": 42.0}), ("tags[10]", {"tags": [f"new{i}" for i in range(10)]})):
+            rebuild = min(timeit.repeat(lambda: rebuild_patch(stored, patch), number=N, repeat=3)) / N * 1e6
+            merge = min(timeit.repeat(lambda: patcher.apply(dict(stored), patch), number=N, repeat=3)) / N * 1e6
+            print(f"{tag_count:>8,} {label:>12} {rebuild:>11.1f} {merge:>9.1f}")
@@ -0,0 +1,39 @@
+# Benchmark: deep-page latency of skip/limit (OFFSET) vs cursor (keyset) pagination
+# Run it with: python bench_pagination.py [rows]
+import sqlite3
+import sys
+import time
+
+from pagination import SortedIndex
+
+LIMIT = 100
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    # A real store: OFFSET has to step over every skipped row, "id > ?" seeks in the primary key index
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, item_name TEXT)")
+    conn.executemany("INSERT INTO items VALUES (?, ?)", ((i, f"item {i}") for i in range(rows)))
+    index = SortedIndex()
+    for i in range(rows):
+        index.insert(i, {"item_name": f"item {i}"})
+
+    print(f"{rows:,} rows, {LIMIT} rows per page, time per page in ms")
+    print(f"{'skip':>10} {'sqlite offset':>14} {'sqlite keyset':>14} {'index offset':>13} {'index keyset':>13}")
+    for skip in (0, rows // 100, rows // 10, rows // 2, rows - LIMIT):
+        offset_sql = timed(lambda: conn.execute("SELECT * FROM items ORDER BY id LIMIT ? OFFSET ?", (LIMIT, skip)).fetchall())
+        keyset_sql = timed(lambda: conn.execute("SELECT * FROM items WHERE id > ? ORDER BY id LIMIT ?", (skip - 1, LIMIT)).fetchall())
+        offset_index = timed(lambda: index.offset_page(skip, LIMIT))
+        keyset_index = timed(lambda: index.page_after(skip - 1, LIMIT))
+        print(f"{skip:>10,} {offset_sql:>14.3f} {keyset_sql:>14.3f} {offset_index:>13.3f} {keyset_index:>13.3f}")
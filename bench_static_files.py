@@ -0,0 +1,81 @@
+# Benchmark: serving static files, StaticFiles vs CachedStaticFiles (static_files.py), called as ASGI apps
+# (no server, no network): a small JS file, the same file revalidated (If-None-Match), a 2 MB file,
+# 64 KB out of the 2 MB file (Range; StaticFiles ignores it and sends everything)
+# Run it with: python bench_static_files.py
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from fastapi.staticfiles import StaticFiles
+
+from static_files import CachedStaticFiles
+
+N = 2_000
+
+
+async def get(app, path, headers):
+    size = 0
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        else:
+            size += len(message.get("body", b""))
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": headers}
+    await app(scope, receive, send)
+    return status, size
+
+
+async def bench(label, app, path, headers, n=N):
+    status, size = await get(app, path, headers)  # Warm up (fills the cache)
+    start = time.perf_counter()
+    for _ in range(n):
+        await get(app, path, headers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {status:>6} {size:>9} {elapsed / n * 1e6:>10.0f}")
+
+
+async def main():
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, "app.js"), "w") as file:
+        file.write("function hello(name) { return 'Hello ' + name; }\n" * 1_000)
+    with open(os.path.join(directory, "big.bin"), "wb") as file:
+        file.write(os.urandom(2 * 1024 * 1024))
+    plain = StaticFiles(directory=directory)
+    cached = CachedStaticFiles(directory=directory)
+    gzip_headers = [(b"accept-encoding", b"gzip")]
+    print(f"{'request':<40} {'status':>6} {'bytes':>9} {'us/req':>10}")
+    for name, app in (("StaticFiles", plain), ("CachedStaticFiles", cached)):
+        await bench(f"{name} app.js", app, "/app.js", gzip_headers)
+        etag = await etag_of(app, "/app.js", gzip_headers)
+        await bench(f"{name} app.js If-None-Match", app, "/app.js", gzip_headers + [(b"if-none-match", etag)])
+        await bench(f"{name} big.bin", app, "/big.bin", [], n=200)
+        await bench(f"{name} big.bin Range 64 KB", app, "/big.bin", [(b"range", b"bytes=1048576-1114111")], n=200)
+    shutil.rmtree(directory)
+
+
+async def etag_of(app, path, headers):
+    etag = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal etag
+        if message["type"] == "http.response.start":
+            etag = dict(message["headers"])[b"etag"]
+
+    await app({"type": "http", "method": "GET", "path": path, "headers": headers}, receive, send)
+    return etag
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+# Benchmark: point reads and concurrent writes of the SQLite item store (storage.py)
+# Run it with: python bench_storage.py
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from storage import SQLiteItemStore
+
+ITEMS = 100_000
+READS = 200_000
+WRITERS = 1_000
+WRITES_PER_WRITER = 20
+
+
+def make_item(i):
+    return {"name": f"Item {i}", "description": "The bartenders", "price": 50.2, "tax": 10.5, "tags": ["a", "b"]}
+
+
+async def main():
+    path = os.path.join(tempfile.mkdtemp(), "items.db")
+    store = SQLiteItemStore(path, initial={f"item{i}": make_item(i) for i in range(ITEMS)})
+    keys = [f"item{random.randrange(ITEMS)}" for _ in range(READS)]
+    await store.count()  # Opens and fills the database
+
+    start = time.perf_counter()
+    for key in keys:
+        await store.get(key)
+    elapsed = time.perf_counter() - start
+    print(f"point reads:   {READS / elapsed:>10,.0f} reads/s")
+
+    # Every writer awaits its write before sending the next one, like requests do
+    async def writer(n):
+        for j in range(WRITES_PER_WRITER):
+            await store.put(f"item{(n * WRITES_PER_WRITER + j) % ITEMS}", make_item(n))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(n) for n in range(WRITERS)))
+    elapsed = time.perf_counter() - start
+    stats = store.stats()
+    print(f"writes:        {WRITERS * WRITES_PER_WRITER / elapsed:>10,.0f} writes/s, {stats['writes_per_commit']:.1f} writes per commit")
+
+    # One write at a time: every write waits for its own commit and fsync
+    start = time.perf_counter()
+    for j in range(200):
+        await store.put(f"item{j}", make_item(j))
+    elapsed = time.perf_counter() - start
+    print(f"serial writes: {200 / elapsed:>10,.0f} writes/s")
+    store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
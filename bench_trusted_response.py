@@ -0,0 +1,45 @@
+# Benchmark: building the JSON response of a stored item, FastAPI's response_model path vs @trusted_response
+# (trusted_response.py), for the routes using it
+# Run it with: python bench_trusted_response.py
+import asyncio
+import timeit
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import main_10
+import main_19
+import main_5
+
+N = 2_000
+
+
+def bench(label, endpoint, item, exclude_unset):
+    model = endpoint.response_plan.model
+    field = create_response_field(name=f"Response_{label}", type_=model)
+    loop = asyncio.new_event_loop()
+
+    def validated():
+        content = loop.run_until_complete(serialize_response(field=field, response_content=item, exclude_unset=exclude_unset))
+        return JSONResponse(content)
+
+    def trusted():
+        return JSONResponse(endpoint.response_plan.render(item))
+
+    assert validated().body == trusted().body
+    slow = min(timeit.repeat(validated, number=N, repeat=3)) / N * 1e6
+    fast = min(timeit.repeat(trusted, number=N, repeat=3)) / N * 1e6
+    print(f"{label:<28} {slow:>10.1f} {fast:>9.1f} {slow / fast:>7.1f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    small = {"name": "Bar", "description": "The bartenders", "price": 62.0, "tax": 20.2, "tags": ["a", "b"]}
+    big = dict(small, tags=[f"tag{i}" for i in range(1_000)])
+    print(f"{'route':<28} {'validated':>10} {'trusted':>9} (us per response)")
+    bench("main_5.read_item", main_5.read_item, small, exclude_unset=True)
+    bench("main_5.read_item 1k tags", main_5.read_item, big, exclude_unset=True)
+    bench("main_10.read_item", main_10.read_item, small, exclude_unset=False)
+    bench("main_10.read_item 1k tags", main_10.read_item, big, exclude_unset=False)
+    bench("main_19.read_main", main_19.read_main, {"id": "foo", "title": "Foo", "description": "There goes my hero"}, exclude_unset=False)
@@ -0,0 +1,80 @@
+# Benchmark: peak memory and throughput of one big multipart upload, File(...) bytes vs StreamedUploads (uploads.py)
+# Run it with: python bench_uploads.py [size in MB, default 512]
+# Every mode runs in its own process, so the peak RSS of one doesn't hide the other's.
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+
+from starlette.requests import Request
+
+CHUNK = 64 * 1024
+BOUNDARY = b"benchboundary"
+
+
+def make_request(size):
+    head = (
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="big.bin"\r\n'
+        b"Content-Type: application/octet-stream\r\n\r\n"
+    )
+    tail = b"\r\n--" + BOUNDARY + b"--\r\n"
+    block = bytes(range(256)) * (CHUNK // 256)
+    chunks = [head] + [block] * (size // CHUNK) + [tail]
+    position = 0
+
+    # The body arrives a chunk at a time, like from the server
+    async def receive():
+        nonlocal position
+        position += 1
+        return {"type": "http.request", "body": chunks[position - 1], "more_body": position < len(chunks)}
+
+    length = len(head) + (size // CHUNK) * CHUNK + len(tail)
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/file/",
+        "headers": [
+            (b"content-type", b"multipart/form-data; boundary=" + BOUNDARY),
+            (b"content-length", str(length).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+
+async def run_bytes(request):
+    form = await request.form()
+    contents = await form["file"].read()  # What file: bytes = File(...) does
+    return len(contents)
+
+
+async def run_streamed(request):
+    from uploads import StreamedForm, StreamedUploads
+
+    form = StreamedForm()
+    await StreamedUploads(max_file_size=4 * 1024**3).parse(request, form)
+    size = form.get_file("file").size
+    form.close()
+    return size
+
+
+def child(mode, size):
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    received = asyncio.run((run_bytes if mode == "bytes" else run_streamed)(make_request(size)))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert received == size // CHUNK * CHUNK
+    print(f"{mode:<9} {(rss_after - rss_before) / 1024:>10.0f} {received / elapsed / 2**20:>8.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        child(sys.argv[1], int(sys.argv[2]))
+    else:
+        size = int(sys.argv[1] if len(sys.argv) > 1 else 512) * 2**20
+        print(f"{size // 2**20} MB upload")
+        print(f"{'mode':<9} {'peak MB+':>10} {'MB/s':>8}")
+        for mode in ("bytes", "streamed"):
+            subprocess.run([sys.executable, __file__, mode, str(size)], check=True)
@@ -0,0 +1,178 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from sqlite_pool import SQLitePool
+from uploads import StreamedFile
+
+# Content-addressed, deduplicating blob store.
+# A file is stored once, under its SHA-256: <root>/ab/cd/abcd... (the fan-out directories keep every
+# directory small). Uploading content that is already stored writes nothing: the upload's temporary
+# file is dropped and the existing blob gets one more reference.
+# - a new blob is flushed to disk (fsync) and renamed into place: a blob path always has the whole content
+# - the reference counts are in SQLite (<root>/blobs.db). Every change runs in a write transaction
+#   (BEGIN IMMEDIATE) that also covers the renames and deletes on disk, so storing a blob and the
+#   garbage collector never race, not even across worker processes
+# - release() drops a reference. collect_garbage() deletes the blobs nobody has referenced for grace
+#   seconds, and the blob files with no row at all (a crash between the rename and the commit)
+#
+#   blob_store = BlobStore("uploads/blobs")
+#   stored = blob_store.put(file)  # {"sha256": ..., "deduplicated": False, "refs": 1}
+
+SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+class InvalidDigest(ValueError):
+    pass
+
+
+class BlobStore:
+    def __init__(self, root: str, fanout: int = 2, grace: float = 3600):
+        self.root = root
+        self.fanout = fanout  # Directory levels, 2 hex digits each
+        self.grace = grace
+        os.makedirs(root, exist_ok=True)
+        self.pool = SQLitePool(os.path.join(root, "blobs.db"), init=self._create_schema)
+        # Metrics
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, refs INTEGER NOT NULL, unreferenced_at REAL"
+            ") WITHOUT ROWID"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # Takes the write lock now, not at the first write
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def path(self, sha256: str) -> str:
+        if not SHA256.fullmatch(sha256):
+            raise InvalidDigest(f"Not a lowercase hex SHA-256: {sha256!r}")
+        return os.path.join(self.root, *(sha256[2 * level:2 * level + 2] for level in range(self.fanout)), sha256)
+
+    def info(self, sha256: str) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT size, refs FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        return None if row is None else {"sha256": sha256, "size": row[0], "refs": row[1]}
+
+    # Blocking, run it in the threadpool. Usable as an ingest.py step, after checksum.
+    # The blob store takes the file over when it's new, a duplicate stays with the form (and is removed with it)
+    def put(self, file: StreamedFile) -> Dict[str, Any]:
+        if file.sha256 is None:
+            raise ValueError("The file has no SHA-256 yet")
+        stored = self.put_path(file.path, file.sha256, file.size)
+        if not stored["deduplicated"]:
+            file.detach()  # Moved into the store
+        return stored
+
+    # The file at path is moved into the store when it's new, a duplicate is left where it is (the caller removes it).
+    # synced: the file is already on disk (fsync), e.g. a resumable upload
+    def put_path(self, path: str, sha256: str, size: int, synced: bool = False) -> Dict[str, Any]:
+        target = self.path(sha256)
+        if not synced and self.info(sha256) is None:
+            # Most likely new: flush it before taking the write lock, the fsync is the slow part
+            _fsync(path)
+            synced = True
+        with self._transaction() as conn:
+            refs = conn.execute(
+                "INSERT INTO blobs (sha256, size, refs) VALUES (?, ?, 1) "
+                "ON CONFLICT (sha256) DO UPDATE SET refs = refs + 1, unreferenced_at = NULL RETURNING refs",
+                (sha256, size),
+            ).fetchone()[0]
+            deduplicated = os.path.exists(target)
+            if deduplicated:
+                self.deduplicated += 1
+                self.bytes_saved += size
+            else:
+                if not synced:
+                    _fsync(path)
+                directory = os.path.dirname(target)
+                os.makedirs(directory, exist_ok=True)
+                os.replace(path, target)
+                _fsync(directory)  # The rename is on disk before the row says the blob exists
+                self.stored += 1
+        return {"sha256": sha256, "deduplicated": deduplicated, "refs": refs}
+
+    # Drops a reference. None: no such blob, or it had no references left
+    def release(self, sha256: str) -> Optional[int]:
+        self.path(sha256)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "UPDATE blobs SET refs = refs - 1, unreferenced_at = CASE WHEN refs = 1 THEN ? END "
+                "WHERE sha256 = ? AND refs > 0 RETURNING refs",
+                (time.time(), sha256),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def collect_garbage(self, grace: Optional[float] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        cutoff = time.time() - (self.grace if grace is None else grace)
+        # Blob files that have been there a while, found without holding the write lock
+        candidates = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if SHA256.fullmatch(name) and os.stat(os.path.join(directory, name)).st_mtime <= cutoff:
+                    candidates.append(name)
+        removed = orphans = freed = 0
+        with self._transaction() as conn:
+            for sha256, size in conn.execute(
+                "DELETE FROM blobs WHERE refs = 0 AND unreferenced_at <= ? RETURNING sha256, size", (cutoff,)
+            ).fetchall():
+                removed += _unlink(self.path(sha256))
+                freed += size
+            for sha256 in candidates:
+                if conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is None:
+                    path = self.path(sha256)
+                    size = os.path.getsize(path) if os.path.exists(path) else 0
+                    if _unlink(path):
+                        orphans += 1
+                        freed += size
+        return {"removed": removed, "orphans": orphans, "bytes_freed": freed, "seconds": round(time.perf_counter() - start, 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            blobs, size, refs, unreferenced = conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0), coalesce(sum(refs), 0), coalesce(sum(refs = 0), 0) FROM blobs"
+            ).fetchone()
+        return {
+            "blobs": blobs,
+            "bytes": size,
+            "references": refs,
+            "unreferenced": unreferenced,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def close(self):
+        self.pool.close()
+
+
+def _unlink(path: str) -> bool:
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)  # Linux flushes the file (or directory) whatever the open mode
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,143 @@
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from fastapi import HTTPException
+
+# Columnar storage of the numeric item fields, for aggregates over the whole catalogue.
+# As dicts, every price is a float object in its own dict: ~100 bytes per number, and a sum is a Python loop.
+# Here price and tax are two float64 arrays (8 bytes per number) and a row is just a position in them:
+# - writes update one position in place, the arrays grow by doubling, removed rows' positions are reused
+# - sums, averages and percentiles of price + tax are computed by NumPy over the whole arrays at once
+# - tags map to the set of positions having them, to group the aggregates by tag
+# A missing price is stored as NaN and left out of the aggregates.
+# set_item() indexes a stored item dict and price_stats() answers /stats/items/, for the apps that keep
+# their items' prices here (main_5, main_10).
+
+
+# A view of one row, nothing is copied: it reads the columns when asked
+class PriceRow:
+    __slots__ = ("_columns", "_position")
+
+    def __init__(self, columns: "PriceColumns", position: int):
+        self._columns = columns
+        self._position = position
+
+    @property
+    def price(self) -> Optional[float]:
+        price = self._columns.price[self._position]
+        return None if np.isnan(price) else float(price)
+
+    @property
+    def tax(self) -> float:
+        return float(self._columns.tax[self._position])
+
+    @property
+    def price_with_tax(self) -> Optional[float]:
+        price = self.price
+        return None if price is None else price + self.tax
+
+
+class PriceColumns:
+    # default_tax: for stored items without a "tax" (the model's default)
+    def __init__(self, capacity: int = 1024, default_tax: float = 0.0):
+        self.default_tax = default_tax
+        self.price = np.full(capacity, np.nan)
+        self.tax = np.zeros(capacity)
+        self._positions: Dict[Hashable, int] = {}
+        self._tags: List[Sequence[str]] = [()] * capacity
+        self._free: List[int] = []
+        self._size = 0  # Positions used so far, free or not
+        self.tag_positions: Dict[str, Set[int]] = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key: Hashable):
+        return key in self._positions
+
+    def __getitem__(self, key: Hashable) -> PriceRow:
+        return PriceRow(self, self._positions[key])
+
+    def _grow(self):
+        capacity = len(self.price) * 2
+        self.price = np.concatenate([self.price, np.full(capacity - len(self.price), np.nan)])
+        self.tax = np.concatenate([self.tax, np.zeros(capacity - len(self.tax))])
+        self._tags.extend([()] * (capacity - len(self._tags)))
+
+    # Insert or update a row
+    def set(self, key: Hashable, price: Optional[float], tax: float, tags: Iterable[str] = ()):
+        position = self._positions.get(key)
+        if position is None:
+            if self._free:
+                position = self._free.pop()
+            else:
+                if self._size == len(self.price):
+                    self._grow()
+                position = self._size
+                self._size += 1
+            self._positions[key] = position
+        self.price[position] = np.nan if price is None else price
+        self.tax[position] = tax
+        self._set_tags(position, tuple(dict.fromkeys(tags)))
+
+    # A stored item dict: price, tax and tags
+    def set_item(self, key: Hashable, item: Dict[str, Any]):
+        self.set(key, item.get("price"), item.get("tax", self.default_tax), item.get("tags", []))
+
+    def remove(self, key: Hashable):
+        position = self._positions.pop(key, None)
+        if position is not None:
+            self._set_tags(position, ())
+            self.price[position] = np.nan
+            self._free.append(position)
+
+    def _set_tags(self, position: int, tags: Sequence[str]):
+        for tag in self._tags[position]:
+            positions = self.tag_positions[tag]
+            positions.discard(position)
+            if not positions:
+                del self.tag_positions[tag]
+        for tag in tags:
+            self.tag_positions.setdefault(tag, set()).add(position)
+        self._tags[position] = tags
+
+    # price + tax of every position, NaN where there's no price (or no row)
+    def price_with_tax(self) -> np.ndarray:
+        return self.price[: self._size] + self.tax[: self._size]
+
+    def summary(self, percentiles: Sequence[float] = (50, 90, 99), tag: Optional[str] = None) -> Dict[str, Any]:
+        totals = self.price_with_tax()
+        if tag is not None:
+            totals = totals[np.fromiter(self.tag_positions.get(tag, ()), dtype=np.intp)]
+        return _summary(totals, percentiles)
+
+    # price + tax is computed once for all the tags
+    def summary_by_tag(self, percentiles: Sequence[float] = (50, 90, 99)) -> Dict[str, Dict[str, Any]]:
+        totals = self.price_with_tax()
+        return {
+            tag: _summary(totals[np.fromiter(positions, dtype=np.intp, count=len(positions))], percentiles)
+            for tag, positions in sorted(self.tag_positions.items())
+        }
+
+
+# Sum, average and percentiles of price + tax over the whole catalogue, the items with a tag, or per tag
+def price_stats(columns: PriceColumns, percentiles: Sequence[float] = (50, 90, 99), tag: Optional[str] = None, by_tag: bool = False) -> Dict[str, Any]:
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise HTTPException(status_code=422, detail="Percentiles must be between 0 and 100")
+    if by_tag:
+        return {"tags": columns.summary_by_tag(percentiles)}
+    return columns.summary(percentiles, tag=tag)
+
+
+def _summary(totals: np.ndarray, percentiles: Sequence[float]) -> Dict[str, Any]:
+    values = totals[~np.isnan(totals)]
+    if not len(values):
+        return {"count": 0, "sum": 0.0, "avg": None, "min": None, "max": None, "percentiles": {}}
+    return {
+        "count": int(len(values)),
+        "sum": float(values.sum()),
+        "avg": float(values.mean()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "percentiles": {f"{p:g}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+    }
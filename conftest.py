@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the apps as modules of this package (from .main_19 import app), the apps import
+# their helpers (storage.py, ...) as top-level modules, like when they're run with uvicorn from here
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
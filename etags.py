@@ -0,0 +1,50 @@
+import hashlib
+import json
+from typing import Any, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+# ETags and conditional requests.
+# The ETag of a resource changes whenever its content changes, so we compute it when the resource
+# is written and keep it next to it. Then:
+# - GET with If-None-Match: <current etag> -> 304 Not Modified, nothing gets serialised or sent
+# - PUT/PATCH with If-Match: <etag the client saw> -> 412 Precondition Failed if somebody else changed
+#   the resource in between (optimistic concurrency, no lost updates)
+# content_etag() hashes the content, version_etag() uses the version the store bumps on every write
+# (no need to serialise anything).
+
+
+def content_etag(data: Any) -> str:
+    body = json.dumps(jsonable_encoder(data), sort_keys=True, separators=(",", ":"))
+    return '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+
+
+def _parse(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+# The version of a resource in the store (see storage.py). The epoch is random per database,
+# so an ETag handed out before the database was recreated never matches again.
+def version_etag(epoch: str, version: int) -> str:
+    return f'"{epoch}-{version}"'
+
+
+# If-None-Match uses the weak comparison: W/"x" matches "x"
+def none_match(header: Optional[str], etag: Optional[str]) -> bool:
+    if not header or etag is None:
+        return False
+    tags = _parse(header)
+    if "*" in tags:
+        return True
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+# If-Match uses the strong comparison. True when the request may go ahead.
+# etag is None when the resource doesn't exist (then only a missing header passes)
+def match(header: Optional[str], etag: Optional[str]) -> bool:
+    if header is None:
+        return True
+    if etag is None:
+        return False
+    tags = _parse(header)
+    return "*" in tags or etag in tags
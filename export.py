@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Tuple, Union
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+# Streaming export of a whole collection.
+# Instead of building one big response, the rows are encoded a few at a time and sent as they are ready:
+# - memory use depends on chunk_size, not on the number of rows
+# - StreamingResponse awaits every send, so a slow client slows the generator down (backpressure)
+#   instead of the response piling up in memory
+# rows is any iterable or async iterable of (key, item) pairs, e.g. the store read in batches.
+
+Rows = Union[Iterable[Tuple[Any, Dict[str, Any]]], AsyncIterable[Tuple[Any, Dict[str, Any]]]]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def _aiter(rows: Rows) -> AsyncIterator[Tuple[Any, Dict[str, Any]]]:
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+async def ndjson_chunks(rows: Rows, key_name: str = "id", chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    buffer = io.BytesIO()
+    async for key, item in _aiter(rows):
+        buffer.write(json.dumps({key_name: key, **jsonable_encoder(item)}, separators=(",", ":")).encode())
+        buffer.write(b"\n")
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# Lists and other non scalar values are written as JSON inside their CSV cell
+async def csv_chunks(rows: Rows, fields: List[str], key_name: str = "id", chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([key_name, *fields])
+    async for key, item in _aiter(rows):
+        item = jsonable_encoder(item)
+        writer.writerow([key, *(_csv_value(item.get(field)) for field in fields)])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+
+# format: "ndjson" or "csv", fields: the CSV columns
+def export_response(rows: Rows, format: str, fields: List[str], key_name: str = "id", filename: str = "export") -> StreamingResponse:
+    if format == "csv":
+        chunks = csv_chunks(rows, fields, key_name=key_name)
+    else:
+        chunks = ndjson_chunks(rows, key_name=key_name)
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
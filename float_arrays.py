@@ -0,0 +1,223 @@
+import io
+import struct
+from typing import Any, Dict, List, NamedTuple, Optional, Type, Union
+
+import numpy as np
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
+from pydantic import parse_obj_as
+from pydantic.error_wrappers import ErrorWrapper
+
+# Binary transport of weight vectors (key -> float), next to JSON.
+# A JSON dict of a few 100k weights spends most of its time in json parsing and pydantic validation,
+# one Python float at a time. As packed little-endian floats, the body *is* the array:
+# numpy.frombuffer() wraps the received bytes without copying or parsing them.
+# Two binary formats, picked with Content-Type (requests) and Accept (responses):
+# - application/octet-stream: a 16 byte header, the values, then the keys if any:
+#     magic "FLTA" | value size: 4 (float32) or 8 (float64) | key kind | 2 unused | count: uint32 | keys size: uint32
+#     keys: none (the keys are the positions 0..count-1), int64 (8 byte aligned) or utf-8 strings separated by NUL
+# - application/x-npy: a NumPy .npy file, of floats (keys are positions) or of records with "key" and "weight" fields
+# The dtype query parameter picks float32 or float64 for binary responses. Values float32 can't hold
+# (e.g. 1e300) are refused instead of being sent as infinity.
+
+JSON = "application/json"
+OCTET_STREAM = "application/octet-stream"
+NPY = "application/x-npy"
+
+MAGIC = b"FLTA"
+HEADER = struct.Struct("<4sBB2xII")
+NO_KEYS, INT_KEYS, STR_KEYS = 0, 1, 2
+DTYPES = {"float32": np.dtype("<f4"), "float64": np.dtype("<f8")}
+
+
+class InvalidArray(ValueError):
+    pass
+
+
+class Weights(NamedTuple):
+    keys: Optional[Union[np.ndarray, List[str]]]  # None: the keys are the positions
+    values: np.ndarray
+
+    def to_dict(self) -> Dict[Any, float]:
+        keys = range(len(self.values)) if self.keys is None else self.keys
+        return dict(zip(keys.tolist() if isinstance(keys, np.ndarray) else keys, self.values.tolist()))
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // 8) * 8
+
+
+# The values as dtype, InvalidArray when a finite value doesn't fit (float64 -> float32)
+def _cast(values: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        cast = np.ascontiguousarray(values, dtype=dtype)
+    if cast.dtype.itemsize < values.dtype.itemsize and not np.array_equal(np.isfinite(cast), np.isfinite(values)):
+        raise InvalidArray(f"Values out of the {dtype.name} range")
+    return cast
+
+
+def encode(weights: Weights, dtype: np.dtype = DTYPES["float64"]) -> bytes:
+    values = _cast(weights.values, dtype)
+    if weights.keys is None:
+        kind, keys = NO_KEYS, b""
+    elif isinstance(weights.keys, np.ndarray):
+        kind, keys = INT_KEYS, np.ascontiguousarray(weights.keys, dtype="<i8").tobytes()
+    else:
+        kind, keys = STR_KEYS, "\0".join(weights.keys).encode()
+    header = HEADER.pack(MAGIC, dtype.itemsize, kind, len(values), len(keys))
+    padding = b"\0" * (_aligned(HEADER.size + values.nbytes) - HEADER.size - values.nbytes) if kind == INT_KEYS else b""
+    return b"".join((header, values.tobytes(), padding, keys))
+
+
+def decode(body: bytes) -> Weights:
+    if len(body) < HEADER.size:
+        raise InvalidArray("Body shorter than the header")
+    magic, value_size, kind, count, keys_size = HEADER.unpack_from(body)
+    dtype = {4: DTYPES["float32"], 8: DTYPES["float64"]}.get(value_size)
+    if magic != MAGIC or dtype is None or kind not in (NO_KEYS, INT_KEYS, STR_KEYS):
+        raise InvalidArray("Invalid header")
+    values_end = HEADER.size + count * value_size
+    keys_start = _aligned(values_end) if kind == INT_KEYS else values_end
+    if len(body) != keys_start + keys_size:
+        raise InvalidArray("Body size doesn't match the header")
+    values = np.frombuffer(body, dtype=dtype, count=count, offset=HEADER.size)
+    if kind == NO_KEYS:
+        keys = None
+    elif kind == INT_KEYS:
+        if keys_size != count * 8:
+            raise InvalidArray("Expected one int64 key per value")
+        keys = np.frombuffer(body, dtype="<i8", count=count, offset=keys_start)
+    else:
+        try:
+            keys = body[keys_start:].decode().split("\0") if count else []
+        except UnicodeDecodeError:
+            raise InvalidArray("Keys are not valid UTF-8")
+        if len(keys) != count:
+            raise InvalidArray("Expected one key per value")
+    return Weights(keys, values)
+
+
+def encode_npy(weights: Weights, dtype: np.dtype = DTYPES["float64"]) -> bytes:
+    if weights.keys is None:
+        array = _cast(weights.values, dtype)
+    else:
+        if isinstance(weights.keys, np.ndarray):
+            key_dtype = np.dtype("<i8")
+        else:
+            key_dtype = np.dtype(f"<U{max(map(len, weights.keys), default=1)}")
+        array = np.empty(len(weights.values), dtype=[("key", key_dtype), ("weight", dtype)])
+        array["key"] = weights.keys
+        array["weight"] = _cast(weights.values, dtype)
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def decode_npy(body: bytes) -> Weights:
+    stream = io.BytesIO(body)
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(stream)
+    except ValueError as error:
+        raise InvalidArray(str(error))
+    if len(shape) != 1 or dtype.hasobject:
+        raise InvalidArray("Expected a one dimensional array without objects")
+    if len(body) - stream.tell() != shape[0] * dtype.itemsize:
+        raise InvalidArray("Body size doesn't match the header")
+    array = np.frombuffer(body, dtype=dtype, count=shape[0], offset=stream.tell())
+    if dtype.kind == "f":
+        return Weights(None, array)
+    if dtype.names and {"key", "weight"} <= set(dtype.names) and dtype["weight"].kind == "f":
+        if dtype["key"].kind == "i":
+            return Weights(array["key"], array["weight"])
+        if dtype["key"].kind == "U":  # String keys, as encode_npy writes them
+            return Weights(array["key"].tolist(), array["weight"])
+    raise InvalidArray("Expected floats, or records with an integer or string key and a float weight")
+
+
+def _media_type(header: Optional[str]) -> str:
+    return (header or JSON).split(";")[0].strip().lower()
+
+
+# The accepted media type with the highest q, JSON when nothing binary is asked for
+def negotiate(accept: Optional[str]) -> str:
+    best, best_q = JSON, 0.0
+    for media_range in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in media_range.lower().split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in (OCTET_STREAM, NPY) and q > best_q:
+            best, best_q = media_type, q
+        elif media_type in (JSON, "application/*", "*/*") and q > best_q:
+            best, best_q = JSON, q
+    return best
+
+
+# Binary bodies get the checks JSON bodies get from Dict[key_type, float]: the key kind, and numbers
+# JSON can represent (NaN and infinity can't be sent back in a JSON response)
+def check_weights(weights: Weights, key_type: Type = int) -> Weights:
+    if key_type is int and isinstance(weights.keys, list):
+        raise InvalidArray("Expected integer keys")
+    if key_type is str and not isinstance(weights.keys, list):
+        raise InvalidArray("Expected string keys")
+    if not np.isfinite(weights.values).all():
+        raise InvalidArray("Values must be finite")
+    return weights
+
+
+# The request body as Weights, whatever its Content-Type. JSON bodies are validated as Dict[key_type, float]
+async def read_weights(request: Request, key_type: Type = int) -> Weights:
+    content_type = _media_type(request.headers.get("content-type"))
+    body = await request.body()
+    try:
+        if content_type == OCTET_STREAM:
+            return check_weights(decode(body), key_type)
+        if content_type == NPY:
+            return check_weights(decode_npy(body), key_type)
+    except InvalidArray as error:
+        raise HTTPException(status_code=400, detail=f"Invalid weights: {error}")
+    if content_type != JSON:
+        raise HTTPException(status_code=415, detail=f"Send {JSON}, {OCTET_STREAM} or {NPY}")
+    try:
+        weights = parse_obj_as(Dict[key_type, float], await request.json())
+    except ValueError as error:  # Invalid JSON or a ValidationError
+        raise RequestValidationError([ErrorWrapper(error, loc=("body",))], body=body)
+    try:
+        keys = np.fromiter(weights, dtype="<i8", count=len(weights)) if key_type is int else list(weights)
+    except OverflowError:  # Valid for Dict[int, float], but not an int64
+        key = next(key for key in weights if not -2**63 <= key < 2**63)
+        raise RequestValidationError([ErrorWrapper(ValueError("ensure this value fits in a 64 bit integer"), loc=("body", str(key), "__key__"))], body=body)
+    values = np.fromiter(weights.values(), dtype="<f8", count=len(weights))
+    if not np.isfinite(values).all():  # json.loads reads NaN and Infinity
+        raise RequestValidationError([ErrorWrapper(ValueError("Values must be finite"), loc=("body",))], body=body)
+    return Weights(keys, values)
+
+
+def weights_response(weights: Weights, media_type: str, dtype: str = "float64") -> Response:
+    try:
+        if media_type == OCTET_STREAM:
+            return Response(encode(weights, DTYPES[dtype]), media_type=OCTET_STREAM)
+        if media_type == NPY:
+            return Response(encode_npy(weights, DTYPES[dtype]), media_type=NPY)
+    except InvalidArray as error:
+        raise HTTPException(status_code=400, detail=f"{error}, use dtype=float64")
+    return JSONResponse(weights.to_dict())
+
+
+# For the OpenAPI docs of endpoints reading or returning weights through a Request/Response
+def openapi_content(key_type: Type = int) -> Dict[str, Any]:
+    key_pattern = {"propertyNames": {"pattern": "^-?[0-9]+$"}} if key_type is int else {}
+    return {
+        JSON: {"schema": {"type": "object", "additionalProperties": {"type": "number"}, **key_pattern}},
+        OCTET_STREAM: {"schema": {"type": "string", "format": "binary"}},
+        NPY: {"schema": {"type": "string", "format": "binary"}},
+    }
@@ -0,0 +1,149 @@
+import asyncio
+import math
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.hash import bcrypt
+
+# bcrypt is slow on purpose (~200 ms at cost 12), so hashing a password inside an "async def"
+# blocks the event loop and every other request waiting on it.
+# HashPool runs hashing and verification in a thread or process pool instead:
+# - at most max_concurrency hashes run at the same time
+# - at most max_queue requests wait for a free slot, more than that are rejected right away
+#   (raise HashPoolFull and turn it into a 503), instead of piling up behind a long queue
+# The functions sent to the pool live at module level so a process pool can pickle them.
+
+
+def _hash(password: str, rounds: Optional[int] = None) -> str:
+    if rounds is None:
+        return bcrypt.hash(password)
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt.verify(password, hashed_password)
+
+
+# Cost (log2 of the number of rounds) a bcrypt hash was created with, e.g. 12 for "$2b$12$..."
+def hash_rounds(hashed_password: str) -> int:
+    return bcrypt.from_string(hashed_password).rounds
+
+
+# Pick the bcrypt cost whose verify time on this host is closest to target_ms.
+# Each extra round doubles the work, so we time a cheap cost and extrapolate
+# instead of trying the expensive costs one by one.
+def calibrate_bcrypt_rounds(target_ms: float = 250, min_rounds: int = 4, max_rounds: int = 16, sample_rounds: int = 8) -> int:
+    hashed_password = _hash("calibration", sample_rounds)
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        _verify("calibration", hashed_password)
+        timings.append(time.perf_counter() - start)
+    sample_ms = min(timings) * 1000
+    rounds = sample_rounds + round(math.log2(target_ms / sample_ms))
+    return max(min_rounds, min(max_rounds, rounds))
+
+
+class HashPoolFull(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self, kind: str = "thread", max_workers: int = 4, max_concurrency: Optional[int] = None, max_queue: int = 64):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown hash pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers
+        self.max_queue = max_queue
+        self.rounds: Optional[int] = None  # None -> passlib's default bcrypt cost
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Metrics
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HashPoolFull()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._finished(start)
+            raise
+        # The slot is released when the job is done, not when the request stops waiting for it:
+        # a cancelled request (client gone) leaves a running job behind, and it still uses a worker.
+        # A job that hasn't started yet is cancelled with the request, which frees the slot right away.
+        future.add_done_callback(lambda _: _call_soon(loop, self._finished, start))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, start: float):
+        elapsed = time.perf_counter() - start
+        self.in_flight -= 1
+        self.completed += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    # A stored hash whose cost differs from the pool's cost should be replaced on the next successful login
+    def needs_rehash(self, hashed_password: str) -> bool:
+        if self.rounds is None:
+            return False
+        return hash_rounds(hashed_password) != self.rounds
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "rounds": self.rounds,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": (self.total_seconds / self.completed * 1000) if self.completed else 0.0,
+            "max_latency_ms": self.max_seconds * 1000,
+        }
+
+
+# Done callbacks run in the executor's thread, the semaphore belongs to the event loop
+def _call_soon(loop: asyncio.AbstractEventLoop, fn, *args):
+    try:
+        loop.call_soon_threadsafe(fn, *args)
+    except RuntimeError:
+        pass  # The loop is closed, and its semaphore with it
@@ -0,0 +1,89 @@
+import base64
+import binascii
+import calendar
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from jose import JWTError
+from jose.exceptions import ExpiredSignatureError
+
+# A JWT codec that only knows HS256.
+# python-jose handles every algorithm and every registered claim, so each token goes through
+# key preparation, header parsing and generic claim checks. Our tokens always use the same key
+# and header, so we do that work once:
+# - the HMAC state is keyed once and copied for every token
+# - the encoded header (and the HMAC state after "<header>.") is computed once
+# - only "exp" and "sub" are checked when decoding
+# The tokens are regular JWTs: python-jose can still decode them and we can decode jose's tokens.
+
+_HEADER = json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":"), sort_keys=True).encode()
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class InvalidTokenError(JWTError):
+    pass
+
+
+class HS256Codec:
+    def __init__(self, secret_key: str):
+        self._mac = hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
+        self._header = _b64encode(_HEADER)
+        self._header_mac = self._mac.copy()
+        self._header_mac.update(self._header + b".")
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        exp = claims.get("exp")
+        if isinstance(exp, datetime):
+            claims = {**claims, "exp": calendar.timegm(exp.utctimetuple())}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        mac = self._header_mac.copy()
+        mac.update(payload)
+        return b".".join((self._header, payload, _b64encode(mac.digest()))).decode()
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        try:
+            header, payload, signature = token.encode().split(b".")
+        except ValueError:
+            raise InvalidTokenError("Not enough segments")
+        if header == self._header:
+            mac = self._header_mac.copy()
+            mac.update(payload)
+        else:
+            # Same claims, but a header we did not write ourselves (e.g. other key order)
+            try:
+                alg = json.loads(_b64decode(header)).get("alg")
+            except (ValueError, binascii.Error, AttributeError):
+                raise InvalidTokenError("Invalid header")
+            if alg != "HS256":
+                raise InvalidTokenError("The specified alg value is not allowed")
+            mac = self._mac.copy()
+            mac.update(header + b"." + payload)
+        try:
+            valid = hmac.compare_digest(mac.digest(), _b64decode(signature))
+            claims = json.loads(_b64decode(payload)) if valid else None
+        except (ValueError, binascii.Error):
+            raise InvalidTokenError("Invalid token")
+        if not valid:
+            raise InvalidTokenError("Signature verification failed")
+        if not isinstance(claims, dict):
+            raise InvalidTokenError("Invalid payload")
+        exp = claims.get("exp")
+        if exp is not None:
+            if not isinstance(exp, (int, float)) or isinstance(exp, bool):
+                raise InvalidTokenError("Expiration Time claim (exp) must be an integer")
+            if exp < time.time():
+                raise ExpiredSignatureError("Signature has expired")
+        if not isinstance(claims.get("sub"), str):
+            raise InvalidTokenError("Subject claim (sub) must be a string")
+        return claims
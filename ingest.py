@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import Request
+
+from uploads import StreamedFile, StreamedForm, StreamedUploads
+
+# Concurrent processing of the files of one multipart upload.
+# Handled one after the other, the per-file work (checksum, content sniffing, persisting) of a 100 file
+# upload adds up on top of receiving it. Here the files go through the steps once the whole body has
+# arrived complete (a truncated upload is rejected before any step runs, see uploads.py), several at once:
+# - the steps are blocking functions run in a thread pool: hashlib and file I/O release the GIL,
+#   so the checksums of several files use several cores
+# - at most max_concurrency files are processed at a time, the others wait for a slot
+# - a failing step only fails its own file, the result says why
+# - when the request fails or goes away, no new step starts, and the temporary files are only removed
+#   once the steps already running in the pool have returned (a thread can't be interrupted)
+# The endpoint gets the form and a result per file: size, sha256, sniffed content type, where it's stored...
+#
+#   ingest = StreamedIngest(StreamedUploads(hash=False), steps=[checksum, sniff_content_type, persist_to(directory)])
+#   @app.post("/files/")
+#   async def create_files(upload: IngestedForm = Depends(ingest)): ...
+
+# A step gets the complete file and returns what it adds to the file's result
+Step = Callable[[StreamedFile], Optional[Dict[str, Any]]]
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# SHA-256 of the file on disk, for uploads streamed with hash=False
+def checksum(file: StreamedFile) -> Dict[str, Any]:
+    file.sha256 = sha256_of(file.file.fileno())
+    return {"sha256": file.sha256}
+
+
+def sha256_of(fd: int) -> str:
+    digest = hashlib.sha256()
+    offset = 0
+    while True:
+        chunk = os.pread(fd, CHUNK_SIZE, offset)  # pread: doesn't move the handle's position
+        if not chunk:
+            break
+        digest.update(chunk)
+        offset += len(chunk)
+    return digest.hexdigest()
+
+
+# First bytes -> content type. Clients send whatever content type they like, the bytes don't lie
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"\x93NUMPY", "application/x-npy"),
+]
+
+
+def sniff_content_type(file: StreamedFile) -> Dict[str, Any]:
+    head = os.pread(file.file.fileno(), 512, 0)
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return {"sniffed_content_type": content_type}
+    try:
+        head.decode()
+    except UnicodeDecodeError as error:
+        if error.start < len(head) - 3:  # Not just a character cut at the end of the 512 bytes
+            return {"sniffed_content_type": "application/octet-stream"}
+    return {"sniffed_content_type": "text/plain"}
+
+
+# Moves the file into directory, under a new name: written to disk first (fsync), then renamed into place,
+# so the directory never has a partial file. The upload's temporary files must be on the same file system.
+def persist_to(directory: str) -> Step:
+    os.makedirs(directory, exist_ok=True)
+
+    def persist(file: StreamedFile) -> Dict[str, Any]:
+        os.fsync(file.file.fileno())
+        name = uuid.uuid4().hex + os.path.splitext(file.filename)[1]
+        os.replace(file.detach(), os.path.join(directory, name))
+        return {"stored_as": name}
+
+    return persist
+
+
+class IngestedForm:
+    def __init__(self, form: StreamedForm, results: List[Dict[str, Any]], elapsed: float):
+        self.form = form
+        self.results = results  # In the order the files were sent
+        self.elapsed = elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(result["size"] for result in self.results)
+        return {
+            "files": len(self.results),
+            "bytes": total,
+            "failed": sum("error" in result for result in self.results),
+            "seconds": round(self.elapsed, 3),
+            "mb_per_s": round(total / 2**20 / self.elapsed, 1) if self.elapsed else None,
+        }
+
+
+class StreamedIngest:
+    def __init__(self, uploads: StreamedUploads, steps: List[Step], max_concurrency: int = 8, executor: Optional[ThreadPoolExecutor] = None):
+        self.uploads = uploads
+        self.steps = steps
+        self.max_concurrency = max_concurrency
+        self._own_executor = executor is None  # Shut down by close(), a shared executor is left to its owner
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ingest")
+
+    # running: the steps submitted to the executor for this request, so they can be waited for
+    async def _process(self, file: StreamedFile, slots: asyncio.Semaphore, running: List[Future]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"field": file.field, "filename": file.filename, "content_type": file.content_type, "size": file.size}
+        if file.sha256 is not None:
+            result["sha256"] = file.sha256
+        async with slots:
+            start = time.perf_counter()
+            for step in self.steps:
+                future = self.executor.submit(step, file)
+                running.append(future)
+                try:
+                    result.update(await asyncio.wrap_future(future) or {})
+                except Exception as error:  # The other files carry on
+                    result["error"] = f"{getattr(step, '__name__', 'step')}: {error}"
+                    break
+            result["seconds"] = round(time.perf_counter() - start, 4)
+        return result
+
+    async def __call__(self, request: Request) -> AsyncIterator[IngestedForm]:
+        form = StreamedForm()
+        slots = asyncio.Semaphore(self.max_concurrency)
+        tasks: List[asyncio.Task] = []
+        running: List[Future] = []
+        start = time.perf_counter()
+        try:
+            await self.uploads.parse(request, form, on_file=lambda file: tasks.append(asyncio.ensure_future(self._process(file, slots, running))))
+            results = await asyncio.gather(*tasks)
+            yield IngestedForm(form, list(results), time.perf_counter() - start)
+        finally:
+            # Cancelling a task stops it from starting more steps, and cancels its step if it hasn't started yet.
+            # A step already running in a thread goes on: wait for it, nothing may still use the files when they're removed
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            in_flight = [asyncio.wrap_future(future) for future in running if not future.done()]
+            if in_flight:
+                await asyncio.wait(in_flight)
+            form.close()
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
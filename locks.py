@@ -0,0 +1,48 @@
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List
+from weakref import WeakKeyDictionary
+
+# Per-key locking for read-modify-write updates, e.g. read an item, change it, write it back.
+# One global lock would make every update wait for every other one, even on unrelated items.
+# A lock per key would need a dict of locks that grows with the keys and must be cleaned up.
+# Lock striping sits in between: a fixed number of locks, and a key always uses the lock at hash(key) % stripes.
+# Updates of different keys almost never wait for each other (only when their keys share a stripe),
+# updates of the same key always do.
+# The locks are asyncio locks: a waiting request doesn't block the event loop. They only
+# order requests within one process, across workers use the store's compare_and_set (see storage.py).
+
+
+class KeyedLocks:
+    def __init__(self, stripes: int = 64):
+        self.stripes = stripes
+        # asyncio locks belong to one event loop, so there's a set of stripes per loop
+        self._locks: "WeakKeyDictionary[asyncio.AbstractEventLoop, List[asyncio.Lock]]" = WeakKeyDictionary()
+        # Metrics
+        self.acquired = 0
+        self.contended = 0
+
+    def _stripe(self, key: Any) -> int:
+        # crc32 rather than hash(): str hashes change between processes
+        return zlib.crc32(str(key).encode()) % self.stripes
+
+    def lock_for(self, key: Any) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        locks = self._locks.get(loop)
+        if locks is None:
+            locks = self._locks[loop] = [asyncio.Lock() for _ in range(self.stripes)]
+        return locks[self._stripe(key)]
+
+    # async with item_locks.hold(item_id): ...
+    @asynccontextmanager
+    async def hold(self, key: Any) -> AsyncIterator[None]:
+        lock = self.lock_for(key)
+        if lock.locked():
+            self.contended += 1
+        async with lock:
+            self.acquired += 1
+            yield
+
+    def stats(self):
+        return {"stripes": self.stripes, "acquired": self.acquired, "contended": self.contended}
@@ -0,0 +1,225 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+# One buffered writer per log file, instead of open + write + close for every message.
+# write() only puts the message in an in-memory queue, a writer thread appends what has queued up in one
+# write() call (one syscall for a whole batch) when:
+# - batch_size bytes are waiting, or
+# - the oldest waiting message is flush_interval seconds old
+# fsync: "never" (the OS writes it out when it likes), "batch" (after every batch: nothing acknowledged
+# by flush() is lost in a crash), "interval" (at most every fsync_interval seconds, and fsync_interval
+# after the last write when traffic stops, so the tail is on disk too)
+# Rotation like logging.handlers.RotatingFileHandler: past max_bytes, log.txt -> log.txt.1 -> log.txt.2 ...
+# keeping backup_count old files.
+# Backpressure: when max_queue messages are waiting (the disk can't keep up), write() waits for room,
+# without blocking the event loop, rather than letting the queue grow without limit.
+# The thread starts with the first message. close() (also called at exit) writes what's left.
+# An I/O error (missing directory, full disk...) drops the batch it happened on, counts it in stats()
+# and reopens the file for the next one: the thread keeps running and flush() always returns.
+#
+#   log_writer = BatchedLogWriter("log.txt")
+#   background_tasks.add_task(log_writer.write, "message\n")
+
+FSYNC_POLICIES = ("never", "batch", "interval")
+
+_STOP = object()
+
+
+class BatchedLogWriter:
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 64 * 1024,
+        flush_interval: float = 0.2,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        max_bytes: Optional[int] = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        max_queue: int = 10_000,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes  # None: no rotation
+        self.backup_count = backup_count
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._last_fsync = 0.0
+        self._dirty = False  # Written since the last fsync
+        # Metrics
+        self.messages = 0
+        self.batches = 0
+        self.bytes = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self.waited = 0  # write() calls that found the queue full
+        self.errors = 0
+        self.dropped = 0  # Messages of the batches that failed (lost, or written but not synced)
+        self.last_error: Optional[str] = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"log-writer {self.path}", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    async def write(self, message: str):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.waited += 1
+            await run_in_threadpool(self._queue.put, message)
+
+    # Blocking variant, for code running in a thread
+    def write_blocking(self, message: str):
+        if self._thread is None:
+            self._start()
+        self._queue.put(message)
+
+    # Returns once everything written before is in the file (and fsynced, unless fsync="never")
+    async def flush(self):
+        await run_in_threadpool(self.flush_blocking)
+
+    def flush_blocking(self):
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.close)
+
+    def _run(self):
+        pending: List[str] = []
+        pending_size = 0
+        deadline = 0.0
+        while True:
+            if pending:
+                timeout: Optional[float] = max(0.0, deadline - time.monotonic())
+            elif self._dirty and self.fsync == "interval":
+                timeout = max(0.0, self._last_fsync + self.fsync_interval - time.monotonic())
+            else:
+                timeout = None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # flush_interval or fsync_interval is up
+            if isinstance(item, str):
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+                pending_size += len(item)
+                if pending_size < self.batch_size and time.monotonic() < deadline:
+                    continue
+            if pending:
+                self._guarded(self._write, "".join(pending), len(pending), messages=len(pending))
+                pending, pending_size = [], 0
+            if item is None:
+                if self._dirty and self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    self._guarded(self._sync)
+            elif isinstance(item, threading.Event):
+                if self.fsync != "never" and self._dirty:
+                    self._guarded(self._sync)
+                item.set()
+            elif item is _STOP:
+                if self.fsync != "never" and self._dirty:
+                    self._guarded(self._sync)
+                self._close_fd()
+                return
+
+    # Runs one write/fsync, an error doesn't stop the thread: the file is reopened for the next batch
+    def _guarded(self, fn, *args, messages: int = 0):
+        try:
+            fn(*args)
+        except Exception as error:
+            self.errors += 1
+            self.last_error = repr(error)
+            self.dropped += messages
+            self._close_fd()
+            self._dirty = False  # Nothing left to sync in a closed file
+
+    def _close_fd(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+
+    def _write(self, text: str, count: int):
+        if self._fd is None:
+            self._open()
+        data = memoryview(text.encode())
+        written = 0
+        while written < len(data):
+            written += os.write(self._fd, data[written:])
+        self._size += len(data)
+        self._dirty = True
+        self.messages += count
+        self.batches += 1
+        self.bytes += len(data)
+        if self.fsync == "batch" or (self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval):
+            self._sync()
+        if self.max_bytes is not None and self._size >= self.max_bytes:
+            self._rotate()
+
+    def _sync(self):
+        os.fsync(self._fd)
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+        self.fsyncs += 1
+
+    def _rotate(self):
+        if self.fsync != "never":
+            self._sync()
+        os.close(self._fd)
+        self._fd = None
+        if self.backup_count > 0:
+            for number in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{number}"):
+                    os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.truncate(self.path, 0)
+        self.rotations += 1
+        self._open()
+
+    def stats(self):
+        return {
+            "messages": self.messages,
+            "batches": self.batches,
+            "bytes": self.bytes,
+            "fsyncs": self.fsyncs,
+            "rotations": self.rotations,
+            "waited": self.waited,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+            "queued": self._queue.qsize(),
+        }
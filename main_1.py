@@ -1,9 +1,13 @@
 from enum import Enum
 from typing import Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
 
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from search_index import InvertedIndex
+from storage import SQLiteItemStore
+
 # If you have a path operation that receives a path parameter, 
 # but you want the possible valid path parameter values to be predefined, 
 # you can use a standard Python Enum.
@@ -25,6 +29,20 @@ app = FastAPI()
 
 fake_items_db = [{"item_name": "Foo"}, {"item_name": "Bar"}, {"item_name": "Baz"}]
 
+# The items are stored in SQLite keyed by id (their position in fake_items_db), see storage.py.
+# Its primary key index gives cursor pagination (see pagination.py).
+# Their names are in a full text index, for ?q= searches (see search_index.py)
+ITEMS_DB_PATH = "main_1_items.db"
+item_store = SQLiteItemStore(ITEMS_DB_PATH, initial=dict(enumerate(fake_items_db)))
+items_search = InvertedIndex()
+for item_id, item in enumerate(fake_items_db):
+    items_search.add(item_id, item["item_name"])
+
+
+@app.on_event("shutdown")
+def close_item_store():
+    item_store.close()
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
@@ -34,9 +52,20 @@ Query parameters -> example.com/items/?skip=0&limit=10 -> skip & limit are query
 Request body -> to be expected from forms and such -> these do not apear in the URL
 '''
 # Query Parameters
+# Pagination: pass the X-Next-Cursor header of the previous page as ?cursor=... to get the next one.
+# skip/limit still work, deep pages are just cheaper and stable with a cursor.
 @app.get("/items/")
-async def read_items(skip: int = 0, limit: int = 10): # Query Parameters
-    return fake_items_db[skip : skip + limit]
+async def read_items(response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None): # Query Parameters
+    if cursor is None:
+        items, next_key = await item_store.offset_page(skip, limit)
+    else:
+        try:
+            items, next_key = await item_store.page_after(decode_cursor(cursor), limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_key is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_key)
+    return items
 
 # Declare Model as a parameter (request body)
 # Use the model
@@ -63,7 +92,9 @@ short, a bool with a default value of False
 async def read_item(item_id: str, needy: str, skip: int = 0, limit: Optional[int] = None, q: Optional[str] = None, short: bool = False):
     item = {"item_id": item_id}
     if q:
-        item.update({"q": q})
+        hits = items_search.search(q, limit=limit or 10)
+        found = await item_store.get_many(doc_id for doc_id, _ in hits)
+        item.update({"q": q, "results": [found[doc_id] for doc_id, _ in hits if doc_id in found]})
     if not short:
         item.update(
             {"description": "This is an amazing item that has a long description"}
@@ -1,9 +1,18 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI
+from fastapi import Body, FastAPI, Header, HTTPException, Query, Response
 from fastapi.encoders import jsonable_encoder # Converts a data type (like a Pydantic model) to something compatible with JSON (like a dict, list, etc).
 from pydantic import BaseModel
 
+import etags
+from columns import PriceColumns, price_stats
+from export import export_response
+from locks import KeyedLocks
+from merge_patch import MergePatcher
+from search_index import InvertedIndex
+from storage import SQLiteItemStore
+from trusted_response import trusted_response
+
 app = FastAPI()
 
 
@@ -21,25 +30,151 @@ items = {
     "baz": {"name": "Baz", "description": None, "price": 50.2, "tax": 10.5, "tags": []},
 }
 
+# The items are stored in SQLite (see storage.py), items is what a new database starts with.
+# The store keeps a version per item, bumped by every PUT/PATCH, the ETags are made from it (see etags.py)
+# They go through Item like every PUT, so what's stored is what read_item may return as it is ("price": 62.0)
+ITEMS_DB_PATH = "main_10_items.db"
+item_store = SQLiteItemStore(ITEMS_DB_PATH, initial={item_id: jsonable_encoder(Item(**item)) for item_id, item in items.items()})
+
+# Full text index of the item names and descriptions, kept up to date by PUT and PATCH (see search_index.py)
+items_search = InvertedIndex()
+
+# PATCH applies JSON merge patches to the stored items, what changed is stored with the new version (see merge_patch.py)
+item_patcher = MergePatcher(Item)
+# PATCHes of the same item run one at a time (read, patch, write back), other items aren't held up (see locks.py)
+item_locks = KeyedLocks()
+
+
+# Price and tax of the stored items as NumPy columns, for /stats/items/ (see columns.py)
+item_prices = PriceColumns(default_tax=Item.__fields__["tax"].default)
+
+
+# The search index and the price columns live in memory, they're built from the store when the app starts
+# (with several workers, each one only indexes its own PUT/PATCHes until it restarts)
+@app.on_event("startup")
+async def index_items():
+    async for item_id, item in item_store.iterate():
+        items_search.add(item_id, item.get("name"), item.get("description"))
+        item_prices.set_item(item_id, item)
+
+
+@app.on_event("shutdown")
+def close_item_store():
+    item_store.close()
+
+
+async def get_stored_item(item_id: str):
+    stored = await item_store.get_versioned(item_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return stored
+
+
+# version is None when the item doesn't exist
+def check_if_match(version: Optional[int], if_match: Optional[str]):
+    etag = etags.version_etag(item_store.epoch, version) if version is not None else None
+    if not etags.match(if_match, etag):
+        raise HTTPException(status_code=412, detail="Item was modified, fetch it again")
+
 
+# new_version is None when compare_and_set found the item changed since we read it
+def check_written(new_version: Optional[int], if_match: Optional[str]) -> int:
+    if new_version is None:
+        if if_match is not None:
+            raise HTTPException(status_code=412, detail="Item was modified, fetch it again")
+        raise HTTPException(status_code=409, detail="Item was modified concurrently, try again")
+    return new_version
+
+
+# Ranked search over the items, the last word also matches as a prefix: ?q=bart finds "The bartenders"
+@app.get("/items/", tags=['items'])
+async def search_items(q: str, limit: int = 10):
+    hits = items_search.search(q, limit=limit)
+    found = await item_store.get_many(item_id for item_id, _ in hits)
+    return [{"item_id": item_id, "score": score, **found[item_id]} for item_id, score in hits if item_id in found]
+
+
+# The whole catalogue as newline-delimited JSON (or CSV), streamed a chunk at a time (see export.py)
+# The store is read in batches, so neither the export nor the store need the whole catalogue in memory
+@app.get("/export/items/", tags=['items'])
+async def export_items(format: str = Query("ndjson", regex="^(ndjson|csv)$")):
+    return export_response(item_store.iterate(), format, fields=list(Item.__fields__), key_name="item_id", filename="items")
+
+
+# Sum, average and percentiles of price + tax over the whole catalogue, the items with a tag, or per tag.
+# Computed by NumPy over the price columns (see columns.py)
+@app.get("/stats/items/", tags=['items'])
+async def item_stats(tag: Optional[str] = None, by_tag: bool = False, percentiles: List[float] = Query([50, 90, 99])):
+    return price_stats(item_prices, percentiles, tag=tag, by_tag=by_tag)
+
+
+# Conditional GET: If-None-Match with the current ETag -> 304, the item isn't even serialised
+# The stored items went through Item when they were written, they're returned without validating them again
+# (see trusted_response.py)
 @app.get("/items/{item_id}", response_model=Item, tags=['items'])
-async def read_item(item_id: str):
-    return items[item_id]
+@trusted_response(Item)
+async def read_item(item_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    stored_item, version = await get_stored_item(item_id)
+    etag = etags.version_etag(item_store.epoch, version)
+    if etags.none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return stored_item
 
 
+# Conditional PUT/PATCH: If-Match with the ETag the client read -> 412 if the item changed since
 @app.put("/items/{item_id}", response_model=Item, tags=['items'], response_description='Updated Item')
-async def update_item(item_id: str, item: Item):
+async def update_item(item_id: str, item: Item, response: Response, if_match: Optional[str] = Header(None)):
     update_item_encoded = jsonable_encoder(item)
-    items[item_id] = update_item_encoded
+    if if_match is None:
+        version = await item_store.put(item_id, update_item_encoded)
+    else:
+        # Only written if the item is still at the version If-Match was checked against
+        stored = await item_store.get_versioned(item_id)
+        check_if_match(stored[1] if stored else None, if_match)
+        version = check_written(await item_store.compare_and_set(item_id, stored[1], update_item_encoded), if_match)
+    response.headers["ETag"] = etags.version_etag(item_store.epoch, version)
+    items_search.update(item_id, update_item_encoded["name"], update_item_encoded["description"])
+    item_prices.set_item(item_id, update_item_encoded)
     return update_item_encoded
 
 #  To use patch(partial updates), you need to set all the values in the pydantic model to optional
 # To distinguish from the models with all optional values for updates and models with required values for creation, you can use the ideas described in main_5.py(Extra models).
-@app.patch("/items/{item_id}", response_model=Item, tags=['items'], response_description='Updated Item')
-async def update_item(item_id: str, item: Item):
-    stored_item_data = items[item_id]
+'''
+The straightforward version rebuilds and re-encodes the whole item for every partial update:
+
     stored_item_model = Item(**stored_item_data)
     update_data = item.dict(exclude_unset=True)
     updated_item = stored_item_model.copy(update=update_data) # See file: try_1.py to see how Pydantic's update parameter is used
-    items[item_id] = jsonable_encoder(updated_item)
-    return updated_item
\ No newline at end of file
+    await item_store.put(item_id, jsonable_encoder(updated_item))
+
+Below the body is a JSON merge patch (RFC 7396) applied to the stored dict,
+only the fields in the patch are validated and written, and null removes a field.
+'''
+@app.patch("/items/{item_id}", response_model=Item, tags=['items'], response_description='Updated Item')
+async def update_item(
+    item_id: str,
+    response: Response,
+    patch: Dict[str, Any] = Body(..., media_type="application/merge-patch+json"),
+    if_match: Optional[str] = Header(None),
+):
+    async with item_locks.hold(item_id):
+        stored_item_data, version = await get_stored_item(item_id)
+        check_if_match(version, if_match)
+        changes = item_patcher.apply(stored_item_data, patch)
+        # The lock orders the PATCHes of this worker, compare_and_set catches writes from other workers and PUTs
+        version = check_written(await item_store.compare_and_set(item_id, version, stored_item_data, delta=changes), if_match)
+    response.headers["ETag"] = etags.version_etag(item_store.epoch, version)
+    if "name" in changes or "description" in changes:
+        items_search.update(item_id, stored_item_data.get("name"), stored_item_data.get("description"))
+    if "price" in changes or "tax" in changes or "tags" in changes:
+        item_prices.set_item(item_id, stored_item_data)
+    return stored_item_data
+
+
+# The changes of the last PATCHes of an item (item_store keeps 100 per item), oldest first.
+# PUTs replace the whole item and record no changes.
+@app.get("/items/{item_id}/changes", tags=['items'])
+async def read_item_changes(item_id: str, after: int = 0, limit: int = Query(100, ge=1, le=1000)):
+    await get_stored_item(item_id)
+    return [{"version": version, "changes": changes} for version, changes in await item_store.deltas(item_id, after, limit)]
@@ -3,20 +3,40 @@ from typing import Optional
 from fastapi import Cookie, Depends, FastAPI, Header
 from fastapi.exceptions import HTTPException
 
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from search_index import InvertedIndex
+from storage import SQLiteItemStore
+
 app = FastAPI()
 
 fake_items_db = [{"item_name": "Foo"}, {"item_name": "Bar"}, {"item_name": "Baz"}]
 
+# The items are stored in SQLite keyed by id (their position in fake_items_db), see storage.py.
+# Its primary key index gives cursor pagination (see pagination.py).
+# Their names are in a full text index, for ?q= searches (see search_index.py)
+ITEMS_DB_PATH = "main_11_items.db"
+item_store = SQLiteItemStore(ITEMS_DB_PATH, initial=dict(enumerate(fake_items_db)))
+items_search = InvertedIndex()
+for item_id, item in enumerate(fake_items_db):
+    items_search.add(item_id, item["item_name"])
+
+
+@app.on_event("shutdown")
+def close_item_store():
+    item_store.close()
+
 # Dependancies based on functions
 async def common_parameters(q: Optional[str] = None, skip: int = 0, limit: int = 100):
     return {"q": q, "skip": skip, "limit": limit}
 
 # Dependancies based on classes
+# cursor: the next_cursor of the previous page, replaces skip
 class CommonQueryParams:
-    def __init__(self, q: Optional[str] = None, skip: int = 0, limit: int = 100):
+    def __init__(self, q: Optional[str] = None, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
         self.q = q
         self.skip = skip
         self.limit = limit
+        self.cursor = cursor
 
 # Dependancy inheritance: First dependancy
 def query_extractor(q: Optional[str] = None):
@@ -73,9 +93,20 @@ async def increment_items(number:Increment = Depends()):
 async def read_items(commons: CommonQueryParams = Depends()):
     response = {}
     if commons.q:
-        response.update({"q": commons.q})
-    items = fake_items_db[commons.skip : commons.skip + commons.limit]
+        # Search results are ranked, best match first
+        hits = items_search.search(commons.q, limit=commons.skip + commons.limit)[commons.skip :]
+        found = await item_store.get_many(doc_id for doc_id, _ in hits)
+        response.update({"q": commons.q, "items": [found[doc_id] for doc_id, _ in hits if doc_id in found], "next_cursor": None})
+        return response
+    if commons.cursor is None:
+        items, next_key = await item_store.offset_page(commons.skip, commons.limit)
+    else:
+        try:
+            items, next_key = await item_store.page_after(decode_cursor(commons.cursor), commons.limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     response.update({"items": items})
+    response.update({"next_cursor": encode_cursor(next_key) if next_key is not None else None})
     return response
 
 @app.get("/queries/", description='Dependancies inheritance based on functions')
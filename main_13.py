@@ -4,6 +4,12 @@ from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
+from user_repository import CachedUserRepository, SQLiteUserRepository
+
+# Users live in SQLite (fake_users_db is only the initial data), with a read-through cache in front
+USERS_DB_PATH = "main_13_users.db"
+USER_CACHE_TTL = 60
+
 fake_users_db = {
     "johndoe": {
         "username": "johndoe",
@@ -42,21 +48,23 @@ class UserInDB(User):
     hashed_password: str
 
 
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
+# Only the users we look up are loaded (see user_repository.py)
+user_repo = CachedUserRepository(SQLiteUserRepository(UserInDB, USERS_DB_PATH, initial=fake_users_db), ttl=USER_CACHE_TTL)
+
 
+async def get_user(db, username: str):
+    return await db.get(username)
 
-def fake_decode_token(token):
+
+async def fake_decode_token(token):
     # This doesn't provide any security at all
     # Check the next version
-    user = get_user(fake_users_db, token)
+    user = await get_user(user_repo, token)
     return user
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    user = fake_decode_token(token)
+    user = await fake_decode_token(token)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -75,10 +83,9 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     # print(f'Scope: { form_data.scope }')
-    user_dict = fake_users_db.get(form_data.username)
-    if not user_dict:
+    user = await get_user(user_repo, form_data.username)
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    user = UserInDB(**user_dict)
     hashed_password = fake_hash_password(form_data.password)
     if not hashed_password == user.hashed_password:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
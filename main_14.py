@@ -1,18 +1,42 @@
 # pip install python-jose[cryptography]
+import asyncio
+import os
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import Depends, FastAPI, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from fastapi import BackgroundTasks, Depends, FastAPI, Form, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError
 from pydantic import BaseModel
 
+from hashing import HashPool, HashPoolFull, calibrate_bcrypt_rounds
+from hs256 import HS256Codec
+from refresh_tokens import REUSED, ROTATED, RefreshTokenStore
+from revocation import RevocationList
+from token_cache import TokenCache
+from user_repository import CachedUserRepository, SQLiteUserRepository
+
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = "0bda3001a885e0b8c34e3cd93f380070b73a4f42471c9546c6d6cbd2e13c1c41"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 30
+TOKEN_CACHE_SIZE = 10_000
+# Password hashing pool: "thread" or "process"
+HASH_POOL_KIND = "thread"
+HASH_POOL_WORKERS = 4
+HASH_MAX_QUEUE = 64
+# The bcrypt cost is calibrated at startup so that verifying a password takes about this long on this host.
+# Set BCRYPT_ROUNDS to pin the cost instead. Hashes with another cost are rehashed on the next login.
+BCRYPT_TARGET_MS = 250
+BCRYPT_ROUNDS: Optional[int] = None
+# Users live in SQLite (fake_users_db is only the initial data), with a read-through cache in front
+USERS_DB_PATH = os.environ.get("MAIN_14_USERS_DB", "main_14_users.db")
+USER_CACHE_TTL = 60
+# Revoked token ids ("jti") until their tokens expire, and refresh token families
+TOKENS_DB_PATH = os.environ.get("MAIN_14_TOKENS_DB", "main_14_tokens.db")
 
 
 fake_users_db = {
@@ -29,6 +53,7 @@ fake_users_db = {
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
 class TokenData(BaseModel):
@@ -46,32 +71,89 @@ class UserInDB(User):
     hashed_password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Only the users we look up are loaded, so this scales to any number of users (see user_repository.py)
+user_repo = CachedUserRepository(SQLiteUserRepository(UserInDB, USERS_DB_PATH, initial=fake_users_db), ttl=USER_CACHE_TTL)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# ALGORITHM is HS256, so tokens go through a dedicated codec instead of jose's generic JWS code (see hs256.py).
+# The tokens are still standard: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]) reads them.
+token_codec = HS256Codec(SECRET_KEY)
+
+# Verified tokens -> resolved user, kept until the token expires (see token_cache.py)
+token_cache = TokenCache(maxsize=TOKEN_CACHE_SIZE)
+
+# Logged out tokens, a Bloom filter answers most checks without touching the database (see revocation.py)
+revocation_list = RevocationList(TOKENS_DB_PATH)
+
+# Refresh tokens renew an access token with an HMAC check instead of a bcrypt verify (see refresh_tokens.py)
+refresh_token_store = RefreshTokenStore(TOKENS_DB_PATH)
+
+# bcrypt runs in a worker pool so it does not block the event loop (see hashing.py)
+hash_pool = HashPool(kind=HASH_POOL_KIND, max_workers=HASH_POOL_WORKERS, max_queue=HASH_MAX_QUEUE)
+
 app = FastAPI()
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+@app.on_event("startup")
+async def calibrate_hash_pool():
+    if BCRYPT_ROUNDS is not None:
+        hash_pool.rounds = BCRYPT_ROUNDS
+    elif BCRYPT_TARGET_MS is not None:
+        loop = asyncio.get_running_loop()
+        hash_pool.rounds = await loop.run_in_executor(None, calibrate_bcrypt_rounds, BCRYPT_TARGET_MS)
+
+
+@app.on_event("startup")
+async def delete_expired_refresh_tokens():
+    await refresh_token_store.delete_expired()
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+@app.on_event("shutdown")
+def shutdown_hash_pool():
+    hash_pool.shutdown()
+    user_repo.repository.pool.close()
+    revocation_list.close()
+    refresh_token_store.pool.close()
 
 
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
+async def verify_password(plain_password, hashed_password):
+    return await hash_pool.verify(plain_password, hashed_password)
 
 
-def authenticate_user(fake_db, username: str, password: str):
-    user = get_user(fake_db, username)
+async def get_password_hash(password):
+    return await hash_pool.hash(password)
+
+
+async def get_user(db, username: str):
+    return await db.get(username)
+
+
+async def save_password_hash(db, username: str, hashed_password: str):
+    await db.update(username, hashed_password=hashed_password)
+    token_cache.invalidate_user(username)
+
+
+# Replace a hash created with an outdated bcrypt cost, runs after the login response was sent
+async def rehash_password(db, username: str, password: str):
+    try:
+        hashed_password = await get_password_hash(password)
+    except HashPoolFull:
+        return  # The pool is busy, the next login will try again
+    await save_password_hash(db, username, hashed_password)
+
+
+# Invalidation hook: cached tokens of a disabled user must not keep working
+async def disable_user(db, username: str):
+    await db.update(username, disabled=True)
+    token_cache.invalidate_user(username)
+
+
+async def authenticate_user(db, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -83,26 +165,45 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.setdefault("jti", uuid.uuid4().hex)  # Token id, so the token can be revoked
+    encoded_jwt = token_codec.encode(to_encode)
     return encoded_jwt
 
 
+# A refresh token lives much longer than an access token, it is only accepted by /token.
+# "fam" is the token family, rotation keeps one valid refresh token per family.
+def create_refresh_token(username: str, family: str, jti: str, expire: datetime):
+    return token_codec.encode({"sub": username, "exp": expire, "jti": jti, "fam": family, "type": "refresh"})
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    # Fast path: this token was already verified and has not expired yet
+    cached = token_cache.get(token)
+    if cached is not None:
+        user, jti = cached.user, cached.jti
+    else:
+        try:
+            payload = token_codec.decode(token)  # checks the signature, "exp" and that "sub" is a string
+            username: str = payload["sub"]
+            token_data = TokenData(username=username)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = get_user(fake_users_db, username=token_data.username)
-    if user is None:
+        if payload.get("type") == "refresh":
+            raise credentials_exception
+        user = await get_user(user_repo, username=token_data.username)
+        if user is None:
+            raise credentials_exception
+        jti = payload.get("jti")
+        expires_at = payload.get("exp")
+        if expires_at is not None:
+            token_cache.put(token, user, expires_at=expires_at, jti=jti)
+    if jti is not None and await revocation_list.is_revoked(jti):
+        token_cache.invalidate(token)
         raise credentials_exception
     return user
 
@@ -113,20 +214,107 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     return current_user
 
 
+# Like OAuth2PasswordRequestForm, but also accepts grant_type=refresh_token with a refresh_token field
+class TokenRequestForm:
+    def __init__(
+        self,
+        grant_type: str = Form("password", regex="^(password|refresh_token)$"),
+        username: Optional[str] = Form(None),
+        password: Optional[str] = Form(None),
+        refresh_token: Optional[str] = Form(None),
+        scope: str = Form(""),
+    ):
+        self.grant_type = grant_type
+        self.username = username
+        self.password = password
+        self.refresh_token = refresh_token
+        self.scopes = scope.split()
+
+
+# The access token carries the refresh token family too ("fam"), so /logout can end the whole login
+async def issue_tokens(username: str, family: Optional[str] = None, refresh_jti: Optional[str] = None):
+    refresh_expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    if family is None:
+        refresh_jti = uuid.uuid4().hex
+        family = await refresh_token_store.start_family(username, refresh_jti, refresh_expire.timestamp())
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": username, "fam": family}, expires_delta=access_token_expires
+    )
+    refresh_token = create_refresh_token(username, family, refresh_jti, refresh_expire)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+# grant_type=refresh_token: rotate the refresh token, no password hashing involved
+async def refresh_access_token(refresh_token: Optional[str]):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if not refresh_token:
+        raise credentials_exception
+    try:
+        payload = token_codec.decode(refresh_token)
+    except JWTError:
+        raise credentials_exception
+    if payload.get("type") != "refresh" or "fam" not in payload or "jti" not in payload:
+        raise credentials_exception
+    user = await get_user(user_repo, payload["sub"])
+    if user is None:
+        raise credentials_exception
+    if user.disabled:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    new_jti = uuid.uuid4().hex
+    refresh_expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    result = await refresh_token_store.rotate(payload["fam"], payload["jti"], new_jti, refresh_expire.timestamp())
+    if result == REUSED:
+        # An old refresh token was used again: the whole family is revoked now
+        credentials_exception.detail = "Refresh token reuse detected"
+        raise credentials_exception
+    if result != ROTATED:
+        raise credentials_exception
+    return await issue_tokens(user.username, family=payload["fam"], refresh_jti=new_jti)
+
+
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+async def login_for_access_token(background_tasks: BackgroundTasks, form_data: TokenRequestForm = Depends()):
+    if form_data.grant_type == "refresh_token":
+        return await refresh_access_token(form_data.refresh_token)
+    if not form_data.username or form_data.password is None:
+        raise HTTPException(status_code=400, detail="username and password are required")
+    try:
+        user = await authenticate_user(user_repo, form_data.username, form_data.password)
+    except HashPoolFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    if hash_pool.needs_rehash(user.hashed_password):
+        background_tasks.add_task(rehash_password, user_repo, user.username, form_data.password)
+    return await issue_tokens(user.username)
+
+
+# Revoke the token used for this request, and the refresh token family of its login:
+# otherwise the refresh token would keep minting new access tokens after the logout.
+# Access tokens refreshed earlier in the family stay valid until they expire (ACCESS_TOKEN_EXPIRE_MINUTES).
+@app.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), current_user: User = Depends(get_current_user)):
+    payload = token_codec.decode(token)
+    if "jti" not in payload or "exp" not in payload:
+        raise HTTPException(status_code=400, detail="This token can't be revoked")
+    await revocation_list.revoke(payload["jti"], payload["exp"])
+    if "fam" in payload:
+        await refresh_token_store.revoke_family(payload["fam"])
+    token_cache.invalidate(token)
+    return {"message": "Logged out"}
 
 
 @app.get("/users/me/", response_model=User)
@@ -136,4 +324,10 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 
 @app.get("/users/me/items/")
 async def read_own_items(current_user: User = Depends(get_current_active_user)):
-    return [{"item_id": "Foo", "owner": current_user.username}]
\ No newline at end of file
+    return [{"item_id": "Foo", "owner": current_user.username}]
+
+
+# Cache hit/miss counters, hash pool queue depth / latency and revocation checks
+@app.get("/metrics/")
+async def read_metrics():
+    return {"token_cache": token_cache.stats(), "user_cache": user_repo.stats(), "hash_pool": hash_pool.stats(), "revocation": revocation_list.stats()}
@@ -1,15 +1,29 @@
 from fastapi import BackgroundTasks, FastAPI
 
+from log_writer import BatchedLogWriter
+
 app = FastAPI()
 
+# One writer appending in batches, instead of opening the file for every notification (see log_writer.py)
+log_writer = BatchedLogWriter("log.txt")
+
+
+# mode="w" truncated the file: only the last notification was ever kept
+# def write_notification(email: str, message=""):
+#     with open("log.txt", mode="w") as email_file:
+#         content = f"notification for {email}: {message}"
+#         email_file.write(content)
 
-def write_notification(email: str, message=""):
-    with open("log.txt", mode="w") as email_file:
-        content = f"notification for {email}: {message}"
-        email_file.write(content)
+async def write_notification(email: str, message=""):
+    await log_writer.write(f"notification for {email}: {message}\n")
 
 
 @app.post("/send-notification/{email}")
 async def send_notification(email: str, background_tasks: BackgroundTasks):
     background_tasks.add_task(write_notification, email, message="some notification")
-    return {"message": "Notification sent in the background"}
\ No newline at end of file
+    return {"message": "Notification sent in the background"}
+
+
+@app.on_event("shutdown")
+def close_log_writer():
+    log_writer.close()
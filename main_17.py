@@ -3,6 +3,9 @@ from typing import Optional
 from fastapi import BackgroundTasks, Depends, FastAPI
 from fastapi.staticfiles import StaticFiles # To mount static files like in Django
 
+from log_writer import BatchedLogWriter
+from static_files import CachedStaticFiles
+
 # Create metadata for tags
 # The order of each tag metadata dictionary also defines the order shown in the docs UI.
 tags_metadata = [
@@ -39,15 +42,26 @@ The name="static" gives it a name that can be used internally by FastAPI.
 
 All these parameters can be different than "static", adjust them with the needs and specific details of your own application.
 '''
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# app.mount("/static", StaticFiles(directory="static"), name="static")
+# Same files, without stat + open on every request: small files cached in memory with gzip/brotli variants,
+# ETags and 304s, large files sent zero-copy (see static_files.py)
+static_files = CachedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
 
 # Using BackgroundTasks
 # Create a task function
-def write_log(message: str):
-    with open("log.txt", mode="a") as log:
-        log.write(message)
-        print('===================')
-        print(f'Printed: {message}')
+# def write_log(message: str):
+#     with open("log.txt", mode="a") as log:
+#         log.write(message)
+#         print('===================')
+#         print(f'Printed: {message}')
+
+# Opening, appending to and closing the file for every message costs more than the message.
+# One writer appends the queued messages in batches (see log_writer.py)
+log_writer = BatchedLogWriter("log.txt")
+
+async def write_log(message: str):
+    await log_writer.write(message)
 
 # Dependency Injection
 def get_query(background_tasks: BackgroundTasks, q: Optional[str] = None):
@@ -65,6 +79,18 @@ async def send_notification(
     background_tasks.add_task(write_log, message)
     return {"message": "Message sent"}
 
+@app.get("/stats/static/")
+async def static_stats():
+    return static_files.stats()
+
+@app.get("/stats/log/")
+async def log_stats():
+    return log_writer.stats()
+
+@app.on_event("shutdown")
+def close_log_writer():
+    log_writer.close()
+
 # metadata for tags
 @app.get("/users/", tags=["users"])
 async def get_users():
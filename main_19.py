@@ -1,8 +1,12 @@
+import os
 from typing import Optional
 
 from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
 
+from storage import SQLiteItemStore
+from trusted_response import trusted_response
+
 fake_secret_token = "coneofsilence"
 
 fake_db = {
@@ -10,29 +14,42 @@ fake_db = {
     "bar": {"id": "bar", "title": "Bar", "description": "The bartenders"},
 }
 
+# The items are stored in SQLite (see storage.py), fake_db is what a new database starts with
+ITEMS_DB_PATH = os.environ.get("MAIN_19_ITEMS_DB", "main_19_items.db")
+item_store = SQLiteItemStore(ITEMS_DB_PATH, initial=fake_db)
+
 app = FastAPI()
 
 
+@app.on_event("shutdown")
+def close_item_store():
+    item_store.close()
+
+
 class Item(BaseModel):
     id: str
     title: str
     description: Optional[str] = None
 
 
+# The stored items went through Item when they were created, they're returned without validating them again
+# (see trusted_response.py)
 @app.get("/items/{item_id}", response_model=Item)
+@trusted_response(Item)
 async def read_main(item_id: str, x_token: str = Header(...)):
     if x_token != fake_secret_token:
         raise HTTPException(status_code=400, detail="Invalid X-Token header")
-    if item_id not in fake_db:
+    item = await item_store.get(item_id)
+    if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    return fake_db[item_id]
+    return item
 
 
 @app.post("/items/", response_model=Item)
 async def create_item(item: Item, x_token: str = Header(...)):
     if x_token != fake_secret_token:
         raise HTTPException(status_code=400, detail="Invalid X-Token header")
-    if item.id in fake_db:
+    # Checked and written in one step, two requests creating the same id can't both succeed
+    if not await item_store.insert_if_absent(item.id, item.dict()):
         raise HTTPException(status_code=400, detail="Item already exists")
-    fake_db[item.id] = item
     return item
\ No newline at end of file
@@ -3,6 +3,8 @@ from typing import Optional
 from fastapi import Body, FastAPI, Path, Query
 from pydantic import BaseModel, Field
 
+from search_index import InvertedIndex
+
 # Field functions the same as Query, Path and Body to declare additional validation and metadata in Pydantic models
 class Item(BaseModel):
     name: str
@@ -17,6 +19,13 @@ class User(BaseModel):
 
 app = FastAPI()
 
+fake_items_db = [{"item_id": "Foo"}, {"item_id": "Bar"}]
+
+# Full text index of the items, ?q= searches it (see search_index.py)
+items_search = InvertedIndex()
+for position, fake_item in enumerate(fake_items_db):
+    items_search.add(position, fake_item["item_id"])
+
 # Additional validation (Using Query class -> Here we set the parameter max_length to 50)
 # async def read_items(q: str = Query(..., min_length=3)): -> Here q is a required parameter declared so by the ... AKA Ellipsis
 # async def read_items(q: Optional[List[str]] = Query(None)): -> Query parameter list (http://localhost:8000/items/?q=foo&q=bar)
@@ -30,11 +39,13 @@ otherwise it would be interpreted as a request body.
 # Query(None, title="Query string", description="Query string for the items", min_length=3) -> title & description is just metadata for OpenAPI documentation
 # Query(None, alias="item-query") -> item-query is what will be used in the URL
 # Query(None, title="Query string", deprecated=True) -> Tells OPenAPI docs the parameter is deprecated
+# Query(None, min_length=3, max_length=50, regex="^fixedquery$") -> q has to match the regular expression
 @app.get("/items/")
-async def read_items(q: Optional[str] = Query(None, min_length=3, max_length=50, regex="^fixedquery$")): # or Query("fixedquery", min_length=3, max_length=50)
-    results = {"items": [{"item_id": "Foo"}, {"item_id": "Bar"}]}
+async def read_items(q: Optional[str] = Query(None, min_length=3, max_length=50)): # or Query("fixedquery", min_length=3, max_length=50)
+    results = {"items": fake_items_db}
     if q:
-        results.update({"q": q})
+        # Only the matching items, best match first
+        results.update({"items": [fake_items_db[position] for position, _ in items_search.search(q)], "q": q})
     return results
 
 '''
@@ -1,8 +1,10 @@
 from typing import Dict, List, Optional, Set
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Query, Request
 from pydantic import BaseModel, HttpUrl
 
+import float_arrays
+
 app = FastAPI()
 
 class Image(BaseModel):
@@ -80,6 +82,17 @@ async def create_multiple_images(images: List[Image]):
 
 # Bodies of arbitrary dicts
 # In this case, you would accept any dict as long as it has int keys with float values:
-@app.post("/index-weights/")
-async def create_index_weights(weights: Dict[int, float]):
-    return weights
\ No newline at end of file
+# @app.post("/index-weights/")
+# async def create_index_weights(weights: Dict[int, float]):
+#     return weights
+# Big weight vectors can also be sent and received as packed float32/float64 arrays,
+# application/octet-stream or application/x-npy, see float_arrays.py.
+# The body is read from the request to pick the format from Content-Type, the response format comes from Accept.
+@app.post(
+    "/index-weights/",
+    openapi_extra={"requestBody": {"required": True, "content": float_arrays.openapi_content(int)}},
+    responses={200: {"content": float_arrays.openapi_content(int)}},
+)
+async def create_index_weights(request: Request, accept: Optional[str] = Header(None), dtype: str = Query("float64", regex="^float(32|64)$")):
+    weights = await float_arrays.read_weights(request, key_type=int)
+    return float_arrays.weights_response(weights, float_arrays.negotiate(accept), dtype)
\ No newline at end of file
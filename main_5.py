@@ -1,8 +1,15 @@
 from typing import List, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, EmailStr
 
+import etags
+from columns import PriceColumns, price_stats
+from export import export_response
+from storage import SQLiteItemStore
+from trusted_response import trusted_response
+
 app = FastAPI()
 
 class Item(BaseModel):
@@ -18,6 +25,29 @@ items = {
     "bar": {"name": "Bar", "description": "The bartenders", "price": 62, "tax": 20.2},
     "baz": {"name": "Baz", "description": None, "price": 50.2, "tax": 10.5, "tags": []},
 }
+
+# The items are stored in SQLite (see storage.py), items is what a new database starts with.
+# The store keeps a version per item, the ETags are made from it (see etags.py)
+# They go through Item first, so what's stored is what read_item may return as it is ("price": 62.0).
+# exclude_unset: the stored keys are the ones that were set, like response_model_exclude_unset expects
+ITEMS_DB_PATH = "main_5_items.db"
+item_store = SQLiteItemStore(ITEMS_DB_PATH, initial={item_id: jsonable_encoder(Item(**item), exclude_unset=True) for item_id, item in items.items()})
+
+# Price and tax of the stored items as NumPy columns, for /stats/items/ (see columns.py)
+item_prices = PriceColumns(default_tax=Item.__fields__["tax"].default)
+
+
+# The price columns live in memory, they're built from the store when the app starts
+@app.on_event("startup")
+async def index_items():
+    async for item_id, item in item_store.iterate():
+        item_prices.set_item(item_id, item)
+
+
+@app.on_event("shutdown")
+def close_item_store():
+    item_store.close()
+
 # class Item(BaseModel):
 #     name: str
 #     description: Optional[str] = None
@@ -108,9 +138,34 @@ response_model_exclude_none=True
 
 as described in the Pydantic docs for exclude_defaults and exclude_none.
 '''
+# If-None-Match with the current ETag -> 304 Not Modified, without a body
+# The stored items are returned as they are, without validating them against Item again (see trusted_response.py)
 @app.get("/items/{item_id}", response_model=Item, response_model_exclude_unset=True, tags=['items'])
-async def read_item(item_id: str):
-    return items[item_id]
+@trusted_response(Item, exclude_unset=True)
+async def read_item(item_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    stored = await item_store.get_versioned(item_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    stored_item, version = stored
+    etag = etags.version_etag(item_store.epoch, version)
+    if etags.none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return stored_item
+
+# The whole catalogue as newline-delimited JSON (or CSV), streamed a chunk at a time (see export.py)
+# The store is read in batches, so neither the export nor the store need the whole catalogue in memory
+@app.get("/export/items/", tags=['items'])
+async def export_items(format: str = Query("ndjson", regex="^(ndjson|csv)$")):
+    return export_response(item_store.iterate(), format, fields=list(Item.__fields__), key_name="item_id", filename="items")
+
+
+# Sum, average and percentiles of price + tax over the whole catalogue, the items with a tag, or per tag.
+# Computed by NumPy over the price columns (see columns.py)
+@app.get("/stats/items/", tags=['items'])
+async def item_stats(tag: Optional[str] = None, by_tag: bool = False, percentiles: List[float] = Query([50, 90, 99])):
+    return price_stats(item_prices, percentiles, tag=tag, by_tag=by_tag)
+
 
 # Deprecate a path operation
 @app.get("/elements/", tags=["items"], deprecated=True)
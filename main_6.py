@@ -1,8 +1,13 @@
-from typing import Dict, List, Union
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI, status
+import numpy as np
+from fastapi import Body, FastAPI, Header, HTTPException, Query, status
 from pydantic import BaseModel
 
+import float_arrays
+from storage import SQLiteItemStore
+from tagged_union import TaggedUnion
+
 app = FastAPI()
 
 
@@ -11,14 +16,24 @@ class BaseItem(BaseModel):
     type: str
 
 
+# The item models, told apart by their "type" (see tagged_union.py)
+item_types = TaggedUnion("type")
+
+
+@item_types.register
 class CarItem(BaseItem):
     type = "car"
 
 
+@item_types.register
 class PlaneItem(BaseItem):
     type = "plane"
     size: int
 
+
+ItemType = item_types.field_type
+item_types.add_to_openapi(app)
+
 class Stuff(BaseModel):
     name: str
     description: str
@@ -38,17 +53,50 @@ items = {
     },
 }
 
+# The items are stored in SQLite (see storage.py), items is what a new database starts with
+ITEMS_DB_PATH = "main_6_items.db"
+item_store = SQLiteItemStore(ITEMS_DB_PATH, initial=items)
+
+
+@app.on_event("shutdown")
+def close_item_store():
+    item_store.close()
+
 # Union or anyOf + status code
-@app.get("/items/{item_id}", response_model=Union[PlaneItem, CarItem], status_code=200)
+# response_model=Union[PlaneItem, CarItem] tries PlaneItem, then CarItem.
+# ItemType picks the model from the item's "type" right away, however many item models there are.
+@app.get("/items/{item_id}", response_model=ItemType, status_code=200)
 async def read_item(item_id: str):
-    return items[item_id]
+    item = await item_store.get(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item
+
+# The same for request bodies: {"type": "plane", ...} is validated as a PlaneItem
+@app.put("/items/{item_id}", response_model=ItemType, status_code=200)
+async def update_item(item_id: str, item: ItemType = Body(...)):
+    await item_store.put(item_id, item.dict())
+    return item
 
 # List of models + status code from starlette imported via fastAPI
 @app.get("/items/", response_model=List[Stuff], status_code=status.HTTP_200_OK)
 async def read_items():
     return items
 
+keyword_weights = {"foo": 2.3, "bar": 3.4}
+# The same weights as arrays, for binary responses (see float_arrays.py)
+keyword_weight_arrays = float_arrays.Weights(list(keyword_weights), np.fromiter(keyword_weights.values(), dtype="<f8"))
+
 # Response with arbitrary dict + status code from starlette imported via fastAPI
-@app.get("/keyword-weights/", response_model=Dict[str, float], status_code=status.HTTP_200_OK)
-async def read_keyword_weights():
-    return {"foo": 2.3, "bar": 3.4}
\ No newline at end of file
+# Accept: application/octet-stream or application/x-npy -> packed float32/float64 arrays instead of JSON
+@app.get(
+    "/keyword-weights/",
+    response_model=Dict[str, float],
+    status_code=status.HTTP_200_OK,
+    responses={200: {"content": float_arrays.openapi_content(str)}},
+)
+async def read_keyword_weights(accept: Optional[str] = Header(None), dtype: str = Query("float64", regex="^float(32|64)$")):
+    media_type = float_arrays.negotiate(accept)
+    if media_type == float_arrays.JSON:
+        return keyword_weights
+    return float_arrays.weights_response(keyword_weight_arrays, media_type, dtype)
\ No newline at end of file
@@ -1,9 +1,47 @@
-from typing import List
+import os
+from typing import List, Optional
 
-from fastapi import FastAPI, Form, File, UploadFile
+from fastapi import Depends, FastAPI, Form, File, Header, HTTPException, Path, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
+from pydantic import BaseModel, Field
+
+import uploads
+from blob_store import BlobStore
+from ingest import IngestedForm, StreamedIngest, checksum, sniff_content_type
+from resumable import PATCH_CONTENT_TYPE, ResumableUploads
+from uploads import StreamedForm, StreamedUploads
 
 app = FastAPI()
+
+# Uploads streamed to disk as they arrive (see uploads.py)
+MAX_FILE_SIZE = 4 * 1024 * 1024 * 1024
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 1024 * 1024  # Room for the multipart headers and form fields
+UPLOAD_DIR = "uploads"
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, "tmp")  # Same file system as the stored files, they're renamed into place
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+# Uploaded files are stored once per content, under their SHA-256 (see blob_store.py)
+blob_store = BlobStore(os.path.join(UPLOAD_DIR, "blobs"))
+streamed_upload = StreamedUploads(max_file_size=MAX_FILE_SIZE, max_request_size=MAX_REQUEST_SIZE, directory=UPLOAD_TMP_DIR)
+
+# Multiple files: checksum, content sniffing and storing run for several files at once,
+# once the whole body has arrived complete (see ingest.py)
+INGEST_CONCURRENCY = 8
+ingest_upload = StreamedIngest(
+    StreamedUploads(max_file_size=MAX_FILE_SIZE, max_request_size=MAX_REQUEST_SIZE, directory=UPLOAD_TMP_DIR, hash=False),
+    # steps=[checksum, sniff_content_type, persist_to(os.path.join(UPLOAD_DIR, "files"))],
+    steps=[checksum, sniff_content_type, blob_store.put],
+    max_concurrency=INGEST_CONCURRENCY,
+)
+
+# Big files: resumable uploads, sent in as many PATCH requests as it takes (see resumable.py)
+# Every open session reserves its file's size on disk, these limits keep anonymous clients from filling it
+RESUMABLE_MAX_SESSIONS = 100
+RESUMABLE_MAX_RESERVED = 4 * MAX_FILE_SIZE
+resumable_uploads = ResumableUploads(
+    os.path.join(UPLOAD_DIR, "resumable"), blob_store, max_size=MAX_FILE_SIZE,
+    max_sessions=RESUMABLE_MAX_SESSIONS, max_reserved=RESUMABLE_MAX_RESERVED,
+)
 '''
 When you need to receive form fields instead of JSON, you can use Form.
 
@@ -27,27 +65,131 @@ async def login(username: str = Form(...), password: str = Form(...)):
     return {"username": username}
 
 
-@app.post("/file/")
-async def create_file(file: bytes = File(...)):
-    return {"file_size": len(file)}
+# bytes: the whole file is read in memory before the endpoint runs
+# @app.post("/file/")
+# async def create_file(file: bytes = File(...)):
+#     return {"file_size": len(file)}
+
+# Streamed: the file is written to disk while it arrives, its size and SHA-256 are known at the end of the upload
+@app.post("/file/", openapi_extra=uploads.openapi_body({"file": True}))
+async def create_file(form: StreamedForm = Depends(streamed_upload)):
+    file = form.get_file("file")
+    stored = await run_in_threadpool(blob_store.put, file)
+    return {"file_size": file.size, "sha256": file.sha256, "deduplicated": stored["deduplicated"]}
 
 # UploadFile uses a "spooled" file:
 # A file stored in memory up to a maximum size limit, and after passing this limit it will be stored in disk.
-@app.post("/uploadfile/")
-async def create_upload_file(file: UploadFile = File(...)):
-    # UploadFile methods (read(size), write(data), and seek(offset:int)), are all async functions and you need to await them
-    contents = await myfile.read()
-    return {"filename": file.filename}
+# @app.post("/uploadfile/")
+# async def create_upload_file(file: UploadFile = File(...)):
+#     # UploadFile methods (read(size), write(data), and seek(offset:int)), are all async functions and you need to await them
+#     contents = await file.read()
+#     return {"filename": file.filename}
+
+# Streamed, the endpoint gets the file on disk: file.file is an open handle at position 0, no need to read it all
+@app.post("/uploadfile/", openapi_extra=uploads.openapi_body({"file": True}))
+async def create_upload_file(form: StreamedForm = Depends(streamed_upload)):
+    file = form.get_file("file")
+    stored = await run_in_threadpool(blob_store.put, file)
+    return {"filename": file.filename, "content_type": file.content_type, "file_size": file.size, **stored}
 
 # Multiple file uploads
-@app.post("/files/")
-async def create_files(files: List[bytes] = File(...)):
-    return {"file_sizes": [len(file) for file in files]}
+# @app.post("/files/")
+# async def create_files(files: List[bytes] = File(...)):
+#     return {"file_sizes": [len(file) for file in files]}
+
+# Multiple file uploads, ingested concurrently: a result per file and the throughput of the whole upload
+@app.post("/files/", openapi_extra=uploads.openapi_body({"files": True}, multiple=True))
+async def create_files(upload: IngestedForm = Depends(ingest_upload)):
+    return {"file_sizes": [result["size"] for result in upload.results], "files": upload.results, "total": upload.stats()}
 
 # Multiple file uploads
-@app.post("/uploadfiles/")
-async def create_upload_files(files: List[UploadFile] = File(...)):
-    return {"filenames": [file.filename for file in files]}
+# @app.post("/uploadfiles/")
+# async def create_upload_files(files: List[UploadFile] = File(...)):
+#     return {"filenames": [file.filename for file in files]}
+
+@app.post("/uploadfiles/", openapi_extra=uploads.openapi_body({"files": True}, multiple=True))
+async def create_upload_files(upload: IngestedForm = Depends(ingest_upload)):
+    return {"filenames": [result["filename"] for result in upload.results], "files": upload.results, "total": upload.stats()}
+
+
+# Resumable uploads
+# POST /uploads/ -> upload id, PATCH /uploads/{id} with Upload-Offset, HEAD /uploads/{id} after a failure,
+# POST /uploads/{id}/complete once every byte is there
+class UploadSession(BaseModel):
+    filename: str
+    size: int = Field(..., ge=0)
+    sha256: Optional[str] = Field(None, regex="^[0-9a-f]{64}$", description="Checked when the upload is completed")
+
+
+def upload_headers(session) -> dict:
+    return {"Upload-Offset": str(session["offset"]), "Upload-Length": str(session["size"]), "Cache-Control": "no-store"}
+
+
+@app.post("/uploads/", status_code=201)
+async def create_upload_session(upload: UploadSession, response: Response):
+    session = await resumable_uploads.create(upload.filename, upload.size, upload.sha256)
+    response.headers["Location"] = f"/uploads/{session['id']}"
+    response.headers.update(upload_headers(session))
+    return session
+
+
+@app.head("/uploads/{upload_id}")
+async def read_upload_progress(upload_id: str):
+    session = await resumable_uploads.status(upload_id)
+    return Response(headers=upload_headers(session))
+
+
+@app.patch(
+    "/uploads/{upload_id}",
+    openapi_extra={"requestBody": {"required": True, "content": {PATCH_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}}}},
+)
+async def append_to_upload(upload_id: str, request: Request, response: Response, upload_offset: int = Header(..., ge=0)):
+    session = await resumable_uploads.append(upload_id, upload_offset, request)
+    response.headers.update(upload_headers(session))
+    return session
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    return await resumable_uploads.complete(upload_id)
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+async def cancel_upload(upload_id: str):
+    await resumable_uploads.cancel(upload_id)
+    return Response(status_code=204)
+
+
+# The stored blobs. A client can ask with HEAD whether the content is already there before uploading it.
+# Only HEAD: there is no owner per blob, so downloading by hash would hand anyone's upload to whoever knows
+# (or guesses) its SHA-256. References are dropped and garbage collected by the server only (see the startup task).
+SHA256_PATH = Path(..., regex="^[0-9a-f]{64}$")
+
+
+@app.head("/blobs/{sha256}")
+async def blob_exists(sha256: str = SHA256_PATH):
+    info = await run_in_threadpool(blob_store.info, sha256)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return Response(headers={"ETag": f'"{sha256}"', "Content-Length": str(info["size"])})
+
+
+@app.get("/stats/blobs/")
+async def blob_stats():
+    return await run_in_threadpool(blob_store.stats)
+
+
+@app.on_event("startup")
+async def collect_garbage_on_startup():
+    await resumable_uploads.expire()
+    await run_in_threadpool(blob_store.collect_garbage)
+
+
+@app.on_event("shutdown")
+def close_stores():
+    ingest_upload.close()  # Its steps write to the blob store
+    resumable_uploads.close()
+    blob_store.close()
 
 
 @app.get("/")
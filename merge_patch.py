@@ -0,0 +1,66 @@
+from typing import Any, Dict, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import ExtraError
+
+# JSON merge patch (RFC 7396) applied straight to a stored item (a dict).
+# A partial update used to rebuild the whole model from the stored dict, copy it with the update
+# and encode the whole result again, so a one field PATCH cost as much as the whole item.
+# MergePatcher only looks at the fields in the patch:
+# - {"price": 3}          -> validates "price" with the model's field and sets it
+# - {"description": null} -> removes "description" from the stored item, reads fall back to the default
+# - {"meta": {"a": 1}}    -> objects are merged recursively into the stored object, then validated
+# Everything is validated before anything is written, so an invalid patch changes nothing (422).
+# apply() returns the changes it made, a compact delta record of the update: main_10 stores it with
+# the item, in the same transaction (see SQLiteItemStore.compare_and_set).
+
+
+def merge(target: Any, patch: Any) -> Any:
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge(result.get(key), value)
+    return result
+
+
+class MergePatcher:
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields = model.__fields__
+
+    def apply(self, stored: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+        changes: Dict[str, Any] = {}  # field -> new value, None when the field was removed
+        errors = []
+        for name, value in patch.items():
+            field = self.fields.get(name)
+            if field is None:
+                errors.append(ErrorWrapper(ExtraError(), loc=("body", name)))
+                continue
+            if value is None:
+                if field.required:
+                    errors.append(ErrorWrapper(ValueError("field required, it can't be removed"), loc=("body", name)))
+                changes[name] = None
+                continue
+            if isinstance(value, dict):
+                value = merge(stored.get(name), value)
+            validated, error = field.validate(value, {}, loc=("body", name), cls=self.model)
+            if error:
+                errors.append(error)
+            else:
+                changes[name] = jsonable_encoder(validated)
+        if errors:
+            raise RequestValidationError(errors)
+        for name, value in changes.items():
+            if value is None:
+                stored.pop(name, None)
+            else:
+                stored[name] = value
+        return changes
+
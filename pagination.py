@@ -0,0 +1,73 @@
+import base64
+import binascii
+import json
+from bisect import bisect_right, insort
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Type
+
+# Keyset (cursor) pagination.
+# skip/limit ("offset") pagination makes a real store walk over every skipped row, so deep pages get slower,
+# and a row inserted before the current position shifts every later page by one.
+# With a cursor we remember the key of the last row we returned and continue right after it:
+# the cost of a page doesn't depend on how deep it is, and inserts elsewhere don't move the rows we haven't seen yet.
+# The cursor is opaque for clients: an url-safe base64 string of the key (an int or a str).
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: Type = int) -> Any:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if type(key) is not key_type:
+        raise InvalidCursor(cursor)
+    return key
+
+
+# Rows ordered by key, the in-memory equivalent of a database index
+class SortedIndex:
+    def __init__(self):
+        self._keys: List[Any] = []
+        self._rows: Dict[Hashable, Any] = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def insert(self, key: Any, row: Any):
+        if key not in self._rows:
+            insort(self._keys, key)
+        self._rows[key] = row
+
+    def remove(self, key: Any):
+        if key in self._rows:
+            del self._rows[key]
+            self._keys.pop(bisect_right(self._keys, key) - 1)
+
+    def get(self, key: Any) -> Optional[Any]:
+        return self._rows.get(key)
+
+    def last_key(self) -> Optional[Any]:
+        return self._keys[-1] if self._keys else None
+
+    # Compatibility path (skip/limit)
+    def offset_page(self, skip: int, limit: int) -> Tuple[List[Any], Optional[Any]]:
+        keys = self._keys[skip : skip + limit]
+        return [self._rows[key] for key in keys], self._next_key(keys)
+
+    # The rows right after after_key (None -> first page)
+    def page_after(self, after_key: Optional[Any], limit: int) -> Tuple[List[Any], Optional[Any]]:
+        start = 0 if after_key is None else bisect_right(self._keys, after_key)
+        keys = self._keys[start : start + limit]
+        return [self._rows[key] for key in keys], self._next_key(keys)
+
+    # Key to continue from, None when the page reached the end
+    def _next_key(self, keys: List[Any]) -> Optional[Any]:
+        if keys and keys[-1] != self._keys[-1]:
+            return keys[-1]
+        return None
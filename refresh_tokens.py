@@ -0,0 +1,81 @@
+import sqlite3
+import time
+import uuid
+
+from sqlite_pool import SQLitePool
+
+# Refresh token rotation with reuse detection.
+# Every login starts a token "family". A family only has one valid refresh token at a time (its jti):
+# using it returns a new refresh token and the old one stops working (rotation).
+# If an old refresh token of the family shows up again, somebody kept a copy of it,
+# so the whole family is revoked and the user has to log in with the password again.
+
+ROTATED = "rotated"
+REUSED = "reused"
+UNKNOWN = "unknown"
+
+
+class RefreshTokenStore:
+    def __init__(self, path: str):
+        self.pool = SQLitePool(path, init=self._create_schema)
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS refresh_families ("
+            "family TEXT PRIMARY KEY, username TEXT NOT NULL, current_jti TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, revoked INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def _start(conn: sqlite3.Connection, family: str, username: str, jti: str, expires_at: float):
+        conn.execute(
+            "INSERT INTO refresh_families (family, username, current_jti, expires_at) VALUES (?, ?, ?, ?)",
+            (family, username, jti, expires_at),
+        )
+
+    @staticmethod
+    def _rotate(conn: sqlite3.Connection, family: str, jti: str, new_jti: str, expires_at: float) -> str:
+        conn.execute("BEGIN IMMEDIATE")  # Two requests must not both rotate the same token
+        try:
+            row = conn.execute("SELECT current_jti, revoked FROM refresh_families WHERE family = ?", (family,)).fetchone()
+            if row is None or row[1]:
+                result = UNKNOWN
+            elif row[0] != jti:
+                conn.execute("UPDATE refresh_families SET revoked = 1 WHERE family = ?", (family,))
+                result = REUSED
+            else:
+                conn.execute(
+                    "UPDATE refresh_families SET current_jti = ?, expires_at = ? WHERE family = ?",
+                    (new_jti, expires_at, family),
+                )
+                result = ROTATED
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def _revoke(conn: sqlite3.Connection, family: str):
+        conn.execute("UPDATE refresh_families SET revoked = 1 WHERE family = ?", (family,))
+
+    @staticmethod
+    def _delete_expired(conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM refresh_families WHERE expires_at <= ?", (now,))
+
+    # Returns the id of the new family
+    async def start_family(self, username: str, jti: str, expires_at: float) -> str:
+        family = uuid.uuid4().hex
+        await self.pool.run(self._start, family, username, jti, expires_at)
+        return family
+
+    # Returns ROTATED (new_jti is now the valid token), REUSED (the family got revoked) or UNKNOWN
+    async def rotate(self, family: str, jti: str, new_jti: str, expires_at: float) -> str:
+        return await self.pool.run(self._rotate, family, jti, new_jti, expires_at)
+
+    async def revoke_family(self, family: str):
+        await self.pool.run(self._revoke, family)
+
+    async def delete_expired(self):
+        await self.pool.run(self._delete_expired, time.time())
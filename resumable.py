@@ -0,0 +1,281 @@
+import errno
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from blob_store import BlobStore
+from ingest import sha256_of
+from sqlite_pool import SQLitePool
+
+# Resumable uploads: a dropped connection doesn't mean sending the whole file again.
+# 1. create a session with the file's size -> an upload id. The file is preallocated at its full size,
+#    so a disk that can't hold it fails now (507), not after most of it has been sent.
+#    Sessions are cheap to open and reserve a lot of disk, so there are at most max_sessions open
+#    sessions (429 past that) holding at most max_reserved bytes together (507)
+# 2. PATCH the bytes from Upload-Offset on. They're written with positional writes (pwrite) into the
+#    preallocated file. When the connection drops, what arrived is kept and counted
+# 3. after a failure, HEAD says how far the upload got (Upload-Offset), PATCH again from there
+# 4. complete: the SHA-256 is checked and the file goes into the blob store (see blob_store.py)
+# The sessions are in SQLite next to the files, so they survive a restart and every worker sees them.
+# A session nobody touched for expiry seconds is removed with its file.
+# Like the tus protocol (tus.io), without the extensions.
+
+PATCH_CONTENT_TYPE = "application/offset+octet-stream"
+
+
+class ResumableUploads:
+    def __init__(
+        self,
+        directory: str,
+        blob_store: BlobStore,
+        max_size: int = 4 * 1024 * 1024 * 1024,
+        flush_size: int = 1024 * 1024,
+        expiry: float = 24 * 3600,
+        expire_interval: float = 600,
+        max_sessions: int = 100,
+        max_reserved: int = 16 * 1024 * 1024 * 1024,
+    ):
+        self.directory = directory  # Same file system as the blob store, the files are renamed into it
+        self.blob_store = blob_store
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.expiry = expiry
+        self.expire_interval = expire_interval
+        self.max_sessions = max_sessions
+        self.max_reserved = max_reserved  # Bytes, the sizes of all open sessions together
+        os.makedirs(directory, exist_ok=True)
+        self.pool = SQLitePool(os.path.join(directory, "sessions.db"), init=self._create_schema)
+        self._busy: Set[str] = set()  # Upload ids with a PATCH or complete in progress in this process
+        self._next_expiry = 0.0
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS upload_sessions ("
+            "id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, upload_offset INTEGER NOT NULL, "
+            "sha256 TEXT, expires_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS upload_sessions_expires_at ON upload_sessions (expires_at)")
+
+    # Inserts the session unless the limits are reached, checked in one write transaction so that
+    # concurrent requests (and workers) can't all pass them. Returns the HTTP status of a refusal, or None
+    @staticmethod
+    def _reserve(conn: sqlite3.Connection, session: Dict[str, Any], max_sessions: int, max_reserved: int, now: float) -> Optional[int]:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            sessions, reserved = conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM upload_sessions WHERE expires_at > ?", (now,)
+            ).fetchone()
+            if sessions >= max_sessions:
+                refusal: Optional[int] = 429
+            elif reserved + session["size"] > max_reserved:
+                refusal = 507
+            else:
+                refusal = None
+                conn.execute(
+                    "INSERT INTO upload_sessions (id, filename, size, upload_offset, sha256, expires_at) "
+                    "VALUES (:id, :filename, :size, :offset, :sha256, :expires_at)",
+                    session,
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return refusal
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, upload_id: str, now: float) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT filename, size, upload_offset, sha256, expires_at FROM upload_sessions WHERE id = ? AND expires_at > ?",
+            (upload_id, now),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": upload_id, "filename": row[0], "size": row[1], "offset": row[2], "sha256": row[3], "expires_at": row[4]}
+
+    # Only moves the offset on from where this PATCH started: another worker may have got there first
+    @staticmethod
+    def _advance(conn: sqlite3.Connection, upload_id: str, start: int, offset: int, expires_at: float) -> bool:
+        cursor = conn.execute(
+            "UPDATE upload_sessions SET upload_offset = ?, expires_at = ? WHERE id = ? AND upload_offset = ?",
+            (offset, expires_at, upload_id, start),
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, upload_id: str):
+        conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+
+    @staticmethod
+    def _delete_expired(conn: sqlite3.Connection, now: float) -> List[str]:
+        return [row[0] for row in conn.execute("DELETE FROM upload_sessions WHERE expires_at <= ? RETURNING id", (now,))]
+
+    def _path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, upload_id + ".part")
+
+    async def _get(self, upload_id: str) -> Dict[str, Any]:
+        session = await self.pool.run(self._select, upload_id, time.time())
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload not found or expired")
+        return session
+
+    async def create(self, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        if time.monotonic() >= self._next_expiry:
+            await self.expire()
+        if size > self.max_size:
+            raise HTTPException(status_code=413, detail="File too large")
+        upload_id = uuid.uuid4().hex  # Unguessable: knowing the id is what allows writing to the upload
+        now = time.time()
+        session = {"id": upload_id, "filename": filename, "size": size, "offset": 0, "sha256": sha256, "expires_at": now + self.expiry}
+        refusal = await self.pool.run(self._reserve, session, self.max_sessions, self.max_reserved, now)
+        if refusal == 429:
+            raise HTTPException(status_code=429, detail="Too many uploads in progress, try again later", headers={"Retry-After": "60"})
+        if refusal == 507:
+            raise HTTPException(status_code=507, detail="Too much space reserved by uploads in progress")
+        try:
+            await run_in_threadpool(_preallocate, self._path(upload_id), size)
+        except BaseException as error:
+            await self.pool.run(self._delete, upload_id)
+            if isinstance(error, OSError) and error.errno == errno.ENOSPC:
+                raise HTTPException(status_code=507, detail="Not enough space for the file")
+            raise
+        return session
+
+    async def status(self, upload_id: str) -> Dict[str, Any]:
+        return await self._get(upload_id)
+
+    # Writes the request body at offset, which must be where the upload stands
+    async def append(self, upload_id: str, offset: int, request: Request) -> Dict[str, Any]:
+        if request.headers.get("content-type") != PATCH_CONTENT_TYPE:
+            raise HTTPException(status_code=415, detail=f"Expected {PATCH_CONTENT_TYPE}")
+        if upload_id in self._busy:
+            raise HTTPException(status_code=409, detail="Another request for this upload is in progress")
+        self._busy.add(upload_id)
+        try:
+            session = await self._get(upload_id)
+            if offset != session["offset"]:
+                raise HTTPException(status_code=409, detail="Wrong offset", headers={"Upload-Offset": str(session["offset"])})
+            fd = await run_in_threadpool(os.open, self._path(upload_id), os.O_WRONLY)
+            position = offset
+            pending: List[bytes] = []
+            pending_size = 0
+            try:
+                try:
+                    async for chunk in request.stream():
+                        if position + pending_size + len(chunk) > session["size"]:
+                            raise HTTPException(status_code=413, detail="More data than the upload's size")
+                        pending.append(chunk)
+                        pending_size += len(chunk)
+                        if pending_size >= self.flush_size:
+                            position += await run_in_threadpool(_pwrite, fd, pending, position)
+                            pending, pending_size = [], 0
+                except ClientDisconnect:
+                    pass  # What arrived is kept, the client resumes from there
+                if pending:
+                    position += await run_in_threadpool(_pwrite, fd, pending, position)
+            finally:
+                # On disk before the offset says it's there
+                await run_in_threadpool(_fsync_and_close, fd)
+                expires_at = time.time() + self.expiry
+                advanced = await self.pool.run(self._advance, upload_id, offset, position, expires_at)
+            if not advanced:
+                raise HTTPException(status_code=409, detail="The upload was changed by another request")
+            session.update(offset=position, expires_at=expires_at)
+            return session
+        finally:
+            self._busy.discard(upload_id)
+
+    # Checks and stores the complete file, the session is gone afterwards
+    async def complete(self, upload_id: str) -> Dict[str, Any]:
+        if upload_id in self._busy:
+            raise HTTPException(status_code=409, detail="Another request for this upload is in progress")
+        self._busy.add(upload_id)
+        try:
+            session = await self._get(upload_id)
+            if session["offset"] != session["size"]:
+                raise HTTPException(status_code=409, detail="Upload incomplete", headers={"Upload-Offset": str(session["offset"])})
+            path = self._path(upload_id)
+            sha256 = await run_in_threadpool(_sha256_of_path, path)
+            if session["sha256"] is not None and sha256 != session["sha256"]:
+                await self.pool.run(self._delete, upload_id)
+                await run_in_threadpool(_unlink, path)
+                raise HTTPException(status_code=422, detail=f"SHA-256 mismatch, the file is {sha256}")
+            stored = await run_in_threadpool(self.blob_store.put_path, path, sha256, session["size"], True)
+            await self.pool.run(self._delete, upload_id)
+            if stored["deduplicated"]:
+                await run_in_threadpool(_unlink, path)
+            return {"filename": session["filename"], "size": session["size"], **stored}
+        finally:
+            self._busy.discard(upload_id)
+
+    async def cancel(self, upload_id: str):
+        if upload_id in self._busy:
+            raise HTTPException(status_code=409, detail="Another request for this upload is in progress")
+        await self._get(upload_id)
+        await self.pool.run(self._delete, upload_id)
+        await run_in_threadpool(_unlink, self._path(upload_id))
+
+    # Removes the expired sessions and their files, runs automatically every expire_interval seconds
+    async def expire(self) -> int:
+        self._next_expiry = time.monotonic() + self.expire_interval
+        expired = await self.pool.run(self._delete_expired, time.time())
+        for upload_id in expired:
+            await run_in_threadpool(_unlink, self._path(upload_id))
+        return len(expired)
+
+    def close(self):
+        self.pool.close()
+
+
+def _preallocate(path: str, size: int):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        if size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError as error:
+                if error.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                os.ftruncate(fd, size)  # No fallocate on this file system: a sparse file
+    except BaseException:
+        os.close(fd)
+        _unlink(path)
+        raise
+    os.close(fd)
+
+
+def _pwrite(fd: int, chunks: List[bytes], offset: int) -> int:
+    data = memoryview(b"".join(chunks))
+    written = 0
+    while written < len(data):
+        written += os.pwrite(fd, data[written:], offset + written)
+    return written
+
+
+def _fsync_and_close(fd: int):
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sha256_of_path(path: str) -> str:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return sha256_of(fd)
+    finally:
+        os.close(fd)
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,203 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from sqlite_pool import SQLitePool
+
+# Token revocation (logout) before a token expires.
+# The denylist of revoked token ids ("jti" claim) is stored in SQLite, that is the authoritative answer.
+# Asking it on every request would add a database round-trip to the hottest path, so an in-memory
+# Bloom filter of the revoked ids sits in front of it:
+# - "not in the filter" -> the token is not revoked, no lookup of the id
+# - "in the filter" may be a false positive -> ask the database
+# Each worker process has its own filter, so a miss is only right while the filter has every revocation.
+# Every revocation bumps a counter row in the same transaction. Before trusting a miss, a worker reads
+# the counter (a one-row read on the event loop, a few microseconds) and, when it moved, first adds the
+# ids revoked since its last look. A token revoked on one worker is refused by all of them right away.
+# A revoked id only matters until its token expires. Compaction deletes the expired entries and
+# rebuilds the filter from what is left, in the threadpool.
+
+INLINE_BUSY_TIMEOUT_MS = 20
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))  # bits
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    # Double hashing: the i-th position is h1 + i * h2
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    def __init__(self, path: str, capacity: int = 100_000, error_rate: float = 0.001, compact_interval: float = 60):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.compact_interval = compact_interval
+        self.pool = SQLitePool(path, init=self._create_schema)
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._seq = 0  # The revocation counter the filter is up to date with
+        self._loaded = False
+        self._loading = False  # A compaction or catch-up is running
+        self._next_compaction = 0.0
+        self._local = threading.local()
+        # Metrics
+        self.checks = 0
+        self.store_lookups = 0
+        self.false_positives = 0
+        self.catch_ups = 0
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+            "jti TEXT PRIMARY KEY, expires_at REAL NOT NULL, seq INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"
+        )
+        if "seq" not in [row[1] for row in conn.execute("PRAGMA table_info(revoked_tokens)")]:
+            conn.execute("ALTER TABLE revoked_tokens ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")  # Created before the counter
+        conn.execute("CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at ON revoked_tokens (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS revoked_tokens_seq ON revoked_tokens (seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS revocation_counter (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO revocation_counter (id, seq) VALUES (0, 0)")
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, jti: str, expires_at: float):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("UPDATE revocation_counter SET seq = seq + 1 WHERE id = 0 RETURNING seq").fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO revoked_tokens (jti, expires_at, seq) VALUES (?, ?, ?)", (jti, expires_at, seq))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _is_revoked(conn: sqlite3.Connection, jti: str, now: float) -> bool:
+        row = conn.execute("SELECT 1 FROM revoked_tokens WHERE jti = ? AND expires_at > ?", (jti, now)).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _counter(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT seq FROM revocation_counter WHERE id = 0").fetchone()[0]
+
+    # The ids revoked after seq, and the counter they bring the filter up to
+    @staticmethod
+    def _revoked_since(conn: sqlite3.Connection, seq: int, now: float) -> Tuple[int, List[str]]:
+        conn.execute("BEGIN")  # One snapshot for the counter and the rows
+        try:
+            counter = RevocationList._counter(conn)
+            jtis = [row[0] for row in conn.execute("SELECT jti FROM revoked_tokens WHERE seq > ? AND expires_at > ?", (seq, now))]
+        finally:
+            conn.execute("COMMIT")
+        return counter, jtis
+
+    @staticmethod
+    def _compact(conn: sqlite3.Connection, now: float) -> Tuple[int, List[str]]:
+        conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,))
+        return RevocationList._revoked_since(conn, -1, now)
+
+    async def revoke(self, jti: str, expires_at: float):
+        await self.pool.run(self._insert, jti, expires_at)
+
+    async def is_revoked(self, jti: str) -> bool:
+        if not self._loaded or time.monotonic() >= self._next_compaction:
+            await self.compact()
+        self.checks += 1
+        if self._loaded and await self._up_to_date() and jti not in self.bloom:
+            return False
+        self.store_lookups += 1
+        revoked = await self.pool.run(self._is_revoked, jti, time.time())
+        if not revoked:
+            self.false_positives += 1
+        return revoked
+
+    # Reads the revocation counter on the event loop. Busy (e.g. a checkpoint): read in the threadpool
+    async def _read_counter(self) -> int:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout={INLINE_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        try:
+            return self._counter(conn)
+        except sqlite3.OperationalError as error:
+            if "locked" not in str(error) and "busy" not in str(error):
+                raise
+            return await self.pool.run(self._counter)
+
+    # True when the filter has every revocation, adding the new ones first if needed.
+    # False while another compaction or catch-up is loading: the caller asks the database.
+    async def _up_to_date(self) -> bool:
+        counter = await self._read_counter()
+        if counter == self._seq:
+            return True
+        if self._loading:
+            return False
+        self._loading = True
+        try:
+            seq, jtis = await self.pool.run(self._revoked_since, self._seq, time.time())
+            await run_in_threadpool(_add_all, self.bloom, jtis)
+            self._seq = seq
+            self.catch_ups += 1
+        finally:
+            self._loading = False
+        return counter <= seq
+
+    # Drop expired entries and rebuild the filter, runs automatically every compact_interval seconds
+    async def compact(self):
+        if self._loading:
+            return
+        self._loading = True
+        self._next_compaction = time.monotonic() + self.compact_interval
+        try:
+            seq, jtis = await self.pool.run(self._compact, time.time())
+            bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+            await run_in_threadpool(_add_all, bloom, jtis)  # Up to capacity SHA-256 hashes, too slow for the event loop
+            self.bloom, self._seq = bloom, seq
+            self._loaded = True
+        finally:
+            self._loading = False
+
+    def stats(self):
+        return {
+            "bloom_entries": self.bloom.count,
+            "bloom_capacity": self.bloom.capacity,
+            "checks": self.checks,
+            "store_lookups": self.store_lookups,
+            "false_positives": self.false_positives,
+            "catch_ups": self.catch_ups,
+        }
+
+    def close(self):
+        self.pool.close()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _add_all(bloom: BloomFilter, jtis: List[str]):
+    for jti in jtis:
+        bloom.add(jti)
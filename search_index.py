@@ -0,0 +1,126 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import islice
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# In-memory full text search over item names and descriptions.
+# An inverted index maps every term to the documents (items) containing it, so a query only
+# looks at the documents that share a term with it instead of scanning every item.
+# - The index is incremental: add/update/remove an item whenever it is written
+# - The last query term also matches as a prefix ("bart" finds "bartenders"), using a sorted vocabulary.
+#   New terms go to a small sorted list first, merged into the big one in batches, so adding
+#   millions of distinct terms doesn't shift the big list for every one of them.
+# - Results are ranked with BM25 (rare terms and short texts score higher). A term found in almost
+#   every item has an idf close to zero, so only the first max_postings of its documents are scored:
+#   that keeps a query like "item" over 1M items as fast as a selective one.
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    # BM25 parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, max_expansions: int = 50, prefix_weight: float = 0.5, max_postings: int = 2000, merge_threshold: int = 4096):
+        self.max_expansions = max_expansions  # Terms a prefix may expand to
+        self.max_postings = max_postings  # Documents scored per query term
+        self.merge_threshold = merge_threshold
+        self.prefix_weight = prefix_weight  # Score factor of a prefix match compared to an exact match
+        self._postings: Dict[str, Dict[Hashable, int]] = {}  # term -> {doc_id: term frequency}
+        self._vocabulary: List[str] = []  # Sorted terms, for prefix lookups
+        self._new_terms: List[str] = []  # Sorted terms not merged into _vocabulary yet
+        self._doc_terms: Dict[Hashable, Counter] = {}
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._doc_terms
+
+    # Index (or re-index) a document, only the terms that changed are touched
+    def update(self, doc_id: Hashable, *texts: Optional[str]):
+        terms = Counter(term for text in texts for term in tokenize(text))
+        old_terms = self._doc_terms.get(doc_id, Counter())
+        for term in old_terms.keys() - terms.keys():
+            self._remove_posting(term, doc_id)
+        for term, count in terms.items():
+            if old_terms.get(term) != count:
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._add_term(term)
+                postings[doc_id] = count
+        length = sum(terms.values())
+        self._total_length += length - self._doc_lengths.get(doc_id, 0)
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = length
+
+    add = update
+
+    def remove(self, doc_id: Hashable):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            self._remove_posting(term, doc_id)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def _remove_posting(self, term: str, doc_id: Hashable):
+        postings = self._postings[term]
+        del postings[doc_id]
+        if not postings:
+            del self._postings[term]
+            for vocabulary in (self._new_terms, self._vocabulary):
+                position = bisect_left(vocabulary, term)
+                if position < len(vocabulary) and vocabulary[position] == term:
+                    del vocabulary[position]
+                    break
+
+    def _add_term(self, term: str):
+        insort(self._new_terms, term)
+        if len(self._new_terms) >= self.merge_threshold:
+            self._vocabulary = sorted(self._vocabulary + self._new_terms)  # Two sorted runs: a linear merge
+            self._new_terms = []
+
+    def _expand(self, prefix: str) -> List[str]:
+        terms = []
+        for vocabulary in (self._vocabulary, self._new_terms):
+            start = bisect_left(vocabulary, prefix)
+            for term in vocabulary[start : start + self.max_expansions]:
+                if not term.startswith(prefix):
+                    break
+                terms.append(term)
+        return sorted(terms)[: self.max_expansions]
+
+    # Best matching (doc_id, score) pairs, best first
+    def search(self, query: str, limit: int = 10) -> List[Tuple[Hashable, float]]:
+        query_terms = tokenize(query)
+        if not query_terms or not self._doc_terms:
+            return []
+        weighted_terms: Dict[str, float] = {term: 1.0 for term in query_terms}
+        for term in self._expand(query_terms[-1]):
+            weighted_terms.setdefault(term, self.prefix_weight)
+
+        doc_count = len(self._doc_terms)
+        average_length = self._total_length / doc_count or 1
+        k1, b, lengths = self.k1, self.b, self._doc_lengths
+        scores: Dict[Hashable, float] = {}
+        for term, weight in weighted_terms.items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5)) * weight
+            for doc_id, tf in islice(postings.items(), self.max_postings):
+                norm = k1 * (1 - b + b * lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda hit: hit[1])
@@ -0,0 +1,68 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+# A small pool of SQLite connections.
+# sqlite3 calls block, so SQLitePool.run() executes them in the threadpool and hands each call
+# its own connection. The database is opened in WAL mode: readers don't block the writer
+# and the writer doesn't block readers, so a few connections can serve many concurrent requests.
+# init(conn) runs once, on the first connection, e.g. to create the tables.
+
+
+class SQLitePool:
+    def __init__(self, path: str, size: int = 4, init: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.path = path
+        self.size = size
+        self._init = init
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # In WAL mode only checkpoints need a full fsync
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = self._connect()
+                if self._created == 0 and self._init is not None:
+                    self._init(conn)
+                self._created += 1
+                return conn
+        return self._idle.get()  # Every connection is in use, wait for one
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    async def run(self, fn: Callable, *args):
+        def call():
+            with self.connection() as conn:
+                return fn(conn, *args)
+
+        return await run_in_threadpool(call)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
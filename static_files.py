@@ -0,0 +1,466 @@
+import gzip
+import hashlib
+import mimetypes
+import mmap
+import os
+import stat
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+import etags
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Static files without the per-request work.
+# StaticFiles resolves, stats and opens the file on every request, and sends it as it is on disk.
+# CachedStaticFiles keeps what it learns about a file:
+# - the metadata (resolved path, size, mtime, ETag, content type) of every file served; the file is only
+#   stat'ed again after check_interval seconds, to notice changes (None: never, for immutable deploys)
+# - small files (up to max_cached_size) in memory, in an LRU bounded by max_cache_bytes, together with
+#   their gzip (and brotli, when installed) variants, compressed once when the file is loaded.
+#   Large files use foo.js.gz / foo.js.br next to them when a build step made them
+# - the variant is picked from Accept-Encoding, responses say Vary: Accept-Encoding
+# - strong ETags (content hash for cached files, inode-size-mtime for large ones, one per variant):
+#   If-None-Match / If-Modified-Since -> 304, nothing sent
+# - large files are sent zero-copy when the server supports it: the ASGI zerocopysend extension
+#   (the server calls os.sendfile on the file) or pathsend. Otherwise they're read in chunks (pread)
+#   in the threadpool. For immutable deploys (check_interval=None, files never rewritten in place),
+#   mmap_files=True copies them out of one mmap per file shared by every request instead: reading
+#   a mapping whose file was truncated kills the process (SIGBUS), so it's never the default
+# - Range requests: one range -> 206 with Content-Range, several -> 206 multipart/byteranges,
+#   none satisfiable -> 416. If-Range with an old ETag or date -> the whole file. Ranges are of the
+#   uncompressed file
+# Anything else (directories, html mode, missing files, other methods) is left to StaticFiles.
+#
+#   app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "image/svg+xml",
+}
+MIN_COMPRESS_SIZE = 256
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 32  # More than that in one request and the Range header is ignored
+
+# A piece of a response body: bytes as they are, or (offset, count) of the file
+Piece = Union[bytes, Tuple[int, int]]
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+class _StaticFile:
+    __slots__ = ("path", "size", "mtime_ns", "inode", "etag", "headers", "body", "variants", "compressible", "checked_at", "mappings")
+
+    def __init__(self, path: str, stat_result: os.stat_result):
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime_ns = stat_result.st_mtime_ns
+        self.inode = stat_result.st_ino
+        self.etag = ""
+        self.headers: Dict[str, str] = {}  # Without the per-variant ones
+        self.body: Optional[bytes] = None  # Cached files only
+        # Encoding -> (body, etag) for cached files, (path, size, etag) for large ones
+        self.variants: Dict[str, tuple] = {}
+        self.compressible = False
+        self.checked_at = 0.0
+        self.mappings: Dict[str, mmap.mmap] = {}  # Path (the file or a variant) -> read-only mapping
+
+    # The mapping every request for this version of the file shares. Dropped with the entry, the
+    # memory is unmapped when the last response using it is done
+    async def mapped(self, path: str) -> mmap.mmap:
+        mapping = self.mappings.get(path)
+        if mapping is None:
+            mapping = self.mappings.setdefault(path, await run_in_threadpool(_map, path))
+        return mapping
+
+    def same_file(self, stat_result: os.stat_result) -> bool:
+        return (self.size, self.mtime_ns, self.inode) == (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+    @property
+    def cost(self) -> int:  # Bytes held in memory
+        if self.body is None:
+            return 0
+        return len(self.body) + sum(len(variant[0]) for variant in self.variants.values())
+
+
+class FileSendResponse(Response):
+    def __init__(
+        self,
+        entry: _StaticFile,
+        path: str,
+        size: int,
+        pieces: List[Piece],
+        headers: Dict[str, str],
+        status_code: int = 200,
+        mmap_file: bool = False,
+    ):
+        super().__init__(status_code=status_code, headers=headers)
+        self.entry = entry
+        self.path = path  # The file or one of its variants, size bytes
+        self.size = size
+        self.pieces = pieces
+        self.mmap_file = mmap_file
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.size == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            file = await run_in_threadpool(open, self.path, "rb")
+            try:
+                for piece in self.pieces:
+                    if isinstance(piece, bytes):
+                        await send({"type": "http.response.body", "body": piece, "more_body": True})
+                    else:
+                        await send({"type": "http.response.zerocopysend", "file": file, "offset": piece[0], "count": piece[1], "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                file.close()
+        elif "http.response.pathsend" in extensions and self.pieces == [(0, self.size)]:
+            await send({"type": "http.response.pathsend", "path": self.path})
+        elif self.mmap_file:
+            mapping = await self.entry.mapped(self.path)
+            await self._send_pieces(send, lambda offset, count: mapping[offset:offset + count])
+        else:
+            fd = await run_in_threadpool(os.open, self.path, os.O_RDONLY)
+            try:
+                await self._send_pieces(send, lambda offset, count: os.pread(fd, count, offset))
+            finally:
+                os.close(fd)
+
+    # read(offset, count) runs in the threadpool: the pages may not be in memory yet
+    async def _send_pieces(self, send: Send, read):
+        for piece in self.pieces:
+            if isinstance(piece, bytes):
+                await send({"type": "http.response.body", "body": piece, "more_body": True})
+                continue
+            position, end = piece[0], piece[0] + piece[1]
+            while position < end:
+                chunk = await run_in_threadpool(read, position, min(CHUNK_SIZE, end - position))
+                if not chunk:  # The file shrank since the headers were sent: end the response short
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                position += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(
+        self,
+        *,
+        max_cached_size: int = 256 * 1024,
+        max_cache_bytes: int = 64 * 1024 * 1024,
+        max_entries: int = 10_000,
+        check_interval: Optional[float] = 1.0,
+        cache_control: Optional[str] = None,
+        mmap_files: bool = False,
+        **kwargs,
+    ):
+        if mmap_files and check_interval is not None:
+            raise ValueError("mmap_files is for immutable files only, it needs check_interval=None")
+        super().__init__(**kwargs)
+        self.mmap_files = mmap_files
+        self.max_cached_size = max_cached_size
+        self.max_cache_bytes = max_cache_bytes
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.cache_control = cache_control
+        self.encodings = ["br", "gzip"] if brotli is not None else ["gzip"]  # In order of preference
+        self._files: "OrderedDict[str, _StaticFile]" = OrderedDict()
+        self._cache_bytes = 0
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.compressed_responses = 0
+        self.range_responses = 0
+        self.unsatisfiable_ranges = 0
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD") or self.html:
+            return await super().get_response(path, scope)
+        entry = await self._lookup(path)
+        if entry is None:
+            return await super().get_response(path, scope)  # 404 (or 401) the StaticFiles way
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if range_header is not None and not self._if_range(request_headers.get("if-range"), entry):
+            range_header = None  # The client's part is from another version: the whole file
+        encoding = None if range_header is not None else self._encoding(entry, request_headers.get("accept-encoding"))
+        headers = dict(entry.headers)
+        if encoding is None:
+            etag, size = entry.etag, entry.size
+        else:
+            etag, size = entry.variants[encoding][-1], _variant_size(entry, encoding)
+            headers["content-encoding"] = encoding
+        headers["etag"] = etag
+        if self._not_modified(request_headers, etag, entry.mtime_ns):
+            self.not_modified += 1
+            del headers["content-type"]
+            return Response(status_code=304, headers=headers)
+        if range_header is not None:
+            try:
+                ranges = parse_range(range_header, entry.size)
+            except RangeNotSatisfiable:
+                self.unsatisfiable_ranges += 1
+                return Response(status_code=416, headers={"content-range": f"bytes */{entry.size}"})
+            if ranges is not None:
+                self.range_responses += 1
+                return self._partial(entry, ranges, headers)
+        headers["content-length"] = str(size)
+        if encoding is not None:
+            self.compressed_responses += 1
+        if entry.body is not None:
+            body = entry.body if encoding is None else entry.variants[encoding][0]
+            return _BytesResponse(body, headers)
+        path_on_disk = entry.path if encoding is None else entry.variants[encoding][0]
+        return FileSendResponse(entry, path_on_disk, size, [(0, size)], headers, mmap_file=self.mmap_files)
+
+    # 206: one range as it is, several as multipart/byteranges
+    def _partial(self, entry: _StaticFile, ranges: List[Tuple[int, int]], headers: Dict[str, str]) -> Response:
+        pieces: List[Piece] = []
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["content-range"] = f"bytes {start}-{end - 1}/{entry.size}"
+            pieces.append((start, end - start))
+        else:
+            boundary = uuid.uuid4().hex
+            for start, end in ranges:
+                part_headers = f"--{boundary}\r\ncontent-type: {headers['content-type']}\r\ncontent-range: bytes {start}-{end - 1}/{entry.size}\r\n\r\n"
+                pieces.extend([part_headers.encode(), (start, end - start), b"\r\n"])
+            pieces.append(f"--{boundary}--\r\n".encode())
+            headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["content-length"] = str(sum(len(piece) if isinstance(piece, bytes) else piece[1] for piece in pieces))
+        if entry.body is not None:
+            body = b"".join(piece if isinstance(piece, bytes) else entry.body[piece[0]:piece[0] + piece[1]] for piece in pieces)
+            return _BytesResponse(body, headers, status_code=206)
+        return FileSendResponse(entry, entry.path, entry.size, pieces, headers, status_code=206, mmap_file=self.mmap_files)
+
+    # Cached entry, reloaded when the file changed. None: not a regular file we can serve
+    async def _lookup(self, path: str) -> Optional[_StaticFile]:
+        now = time.monotonic()
+        entry = self._files.get(path)
+        if entry is not None:
+            if self.check_interval is None or now - entry.checked_at < self.check_interval:
+                self._files.move_to_end(path)
+                self.hits += 1
+                return entry
+            try:
+                stat_result = await run_in_threadpool(os.stat, entry.path)
+            except OSError:
+                stat_result = None
+            if stat_result is not None and entry.same_file(stat_result):
+                entry.checked_at = now
+                self._files.move_to_end(path)
+                self.hits += 1
+                return entry
+            self._forget(path)
+        self.misses += 1
+        try:
+            full_path, stat_result = await run_in_threadpool(self.lookup_path, path)
+        except PermissionError:
+            return None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+        entry = await run_in_threadpool(self._load, full_path, stat_result)
+        entry.checked_at = now
+        self._remember(path, entry)
+        return entry
+
+    # Blocking: reads (and compresses) a small file, finds the precompressed siblings of a large one
+    def _load(self, full_path: str, stat_result: os.stat_result) -> _StaticFile:
+        entry = _StaticFile(full_path, stat_result)
+        content_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        entry.compressible = content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+        entry.headers = {
+            "content-type": content_type + "; charset=utf-8" if content_type.startswith("text/") else content_type,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+        }
+        if entry.compressible:
+            entry.headers["vary"] = "Accept-Encoding"
+        if self.cache_control is not None:
+            entry.headers["cache-control"] = self.cache_control
+        if entry.size <= self.max_cached_size:
+            with open(full_path, "rb") as file:
+                entry.body = file.read()
+            digest = hashlib.sha256(entry.body).hexdigest()[:32]
+            entry.etag = f'"{digest}"'
+            if entry.compressible and len(entry.body) >= MIN_COMPRESS_SIZE:
+                for encoding in self.encodings:
+                    compressed = _compress(entry.body, encoding)
+                    if len(compressed) < len(entry.body) * 0.9:  # Not worth a Content-Encoding otherwise
+                        entry.variants[encoding] = (compressed, f'"{digest}-{encoding}"')
+        else:
+            entry.etag = f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+            if entry.compressible:
+                for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                    try:
+                        variant = os.stat(full_path + suffix)
+                    except OSError:
+                        continue
+                    if variant.st_mtime_ns >= stat_result.st_mtime_ns:  # Not left over from an older version
+                        entry.variants[encoding] = (full_path + suffix, variant.st_size, f'{entry.etag[:-1]}-{encoding}"')
+        return entry
+
+    def _remember(self, path: str, entry: _StaticFile):
+        self._forget(path)  # Two concurrent misses of one path both load it, the second replaces the first
+        self._files[path] = entry
+        self._cache_bytes += entry.cost
+        while self._files and (self._cache_bytes > self.max_cache_bytes or len(self._files) > self.max_entries):
+            self._forget(next(iter(self._files)))
+
+    def _forget(self, path: str):
+        entry = self._files.pop(path, None)
+        if entry is not None:
+            self._cache_bytes -= entry.cost
+
+    def _encoding(self, entry: _StaticFile, accept_encoding: Optional[str]) -> Optional[str]:
+        if not entry.variants or not accept_encoding:
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in self.encodings:
+            if encoding in entry.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return None
+
+    # If-Range: the Range applies if the client's copy is the current one (strong ETag, or exact date)
+    @staticmethod
+    def _if_range(if_range: Optional[str], entry: _StaticFile) -> bool:
+        if if_range is None:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == entry.etag
+        try:
+            return parsedate_to_datetime(if_range).timestamp() == entry.mtime_ns // 1_000_000_000
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _not_modified(headers: Headers, etag: str, mtime_ns: int) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:  # Takes precedence over If-Modified-Since
+            return etags.none_match(if_none_match, etag)
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return mtime_ns // 1_000_000_000 <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def stats(self):
+        return {
+            "files": len(self._files),
+            "cache_bytes": self._cache_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "compressed_responses": self.compressed_responses,
+            "range_responses": self.range_responses,
+            "unsatisfiable_ranges": self.unsatisfiable_ranges,
+            "mapped_files": sum(len(entry.mappings) for entry in self._files.values()),
+            "encodings": self.encodings,
+        }
+
+
+class _BytesResponse(Response):
+    # The headers are complete (content-length included), the body is sent as it is, also for HEAD
+    def __init__(self, body: bytes, headers: Dict[str, str], status_code: int = 200):
+        super().__init__(status_code=status_code, headers=headers)
+        self.body = body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else self.body})
+
+
+# Range: bytes=0-499, 500-, -200 -> [(start, end)], end excluded, sorted, overlapping ranges merged.
+# None: not a valid bytes range (or too many), the header is ignored
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    items = specs.split(",")
+    if len(items) > MAX_RANGES:
+        return None
+    for item in items:
+        first, dash, last = item.strip().partition("-")
+        if not dash or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:  # The last bytes
+            suffix = int(last)
+            if suffix > 0 and size > 0:
+                ranges.append((max(0, size - suffix), size))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = int(last) + 1 if last else size
+        if start < size:
+            ranges.append((start, min(end, size)))
+    if not ranges:
+        raise RangeNotSatisfiable(header)
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# Encoding -> q value
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)  # mtime=0: the same bytes every time
+
+
+def _variant_size(entry: _StaticFile, encoding: str) -> int:
+    variant = entry.variants[encoding]
+    return len(variant[0]) if entry.body is not None else variant[1]
+
+
+def _map(path: str) -> mmap.mmap:
+    with open(path, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)  # Stays valid after the file is closed
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import queue
+import secrets
+import sqlite3
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+# Persistent item storage: SQLite in WAL mode behind an async repository interface.
+# Every app used to keep its items in a module level dict, lost on restart and not shared between workers.
+# SQLiteItemStore keeps (key -> JSON value) rows in a table, with a version bumped on every write.
+# - Reads: a point read by primary key takes a few microseconds, less than handing it to a thread,
+#   so get()/get_versioned() run right away on the event loop, with a short busy timeout (if the
+#   database is busy anyway, the read is retried in the threadpool). Everything whose cost grows with
+#   the data (get_many, scans, offsets, count) runs in the threadpool. In WAL mode readers never wait
+#   for the writer, and each thread has its own connections.
+# - Writes: one writer thread owns the write connection. Requests queue their writes and await them.
+#   The writer commits everything that queued up while the previous commit was running as one
+#   transaction (group commit): under load many writes share one transaction and one fsync.
+# - Crash safety: synchronous=FULL on the writer, so a write is only acknowledged once it's on disk.
+# Keys are ints or strs (the key column has no type, so ints keep sorting as numbers).
+# compare_and_set() can record a delta (e.g. the changes of a PATCH) in the same transaction as the write,
+# the last keep_deltas of every key are kept in <table>_deltas and read with deltas().
+
+_CLOSE = object()
+
+INLINE_BUSY_TIMEOUT_MS = 20
+
+
+class SQLiteItemStore:
+    # initial: rows inserted when the database is created, e.g. the app's fake db dict
+    def __init__(self, path: str, table: str = "items", initial: Optional[Dict[Any, Any]] = None, max_batch: int = 512, keep_deltas: int = 100):
+        self.path = path
+        self.table = table
+        self.keep_deltas = keep_deltas
+        self.initial = initial or {}
+        self.max_batch = max_batch
+        self.epoch: Optional[str] = None  # Random id of this database, e.g. for ETags
+        self._local = threading.local()
+        self._writes: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._open_lock = threading.Lock()
+        # Metrics
+        self.commits = 0
+        self.committed_writes = 0
+
+    # Opened on first use, so the app doesn't need a startup event
+    def _open(self):
+        with self._open_lock:
+            if self._writer is not None:
+                return
+            conn = self._connect()
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL) WITHOUT ROWID")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table}_deltas "
+                f"(key NOT NULL, version INTEGER NOT NULL, changes TEXT NOT NULL, PRIMARY KEY (key, version)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO store_meta (name, value) VALUES ('epoch', ?)", (secrets.token_hex(4),))
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {self.table} (key, value, version) VALUES (?, ?, 1)",
+                    [(key, json.dumps(value)) for key, value in self.initial.items()],
+                )
+            self.epoch = conn.execute("SELECT value FROM store_meta WHERE name = 'epoch'").fetchone()[0]
+            self._writer = threading.Thread(target=self._write_loop, args=(conn,), name=f"{self.table}-writer", daemon=True)
+            self._writer.start()
+
+    def _connect(self, busy_timeout_ms: int = 5000) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        return conn
+
+    # inline: the connection for reads on the event loop, it gives up quickly when the database is busy
+    def _reader(self, inline: bool = False) -> sqlite3.Connection:
+        if self._writer is None:
+            self._open()
+        name = "inline_conn" if inline else "conn"
+        conn = getattr(self._local, name, None)
+        if conn is None:
+            conn = self._connect(INLINE_BUSY_TIMEOUT_MS if inline else 5000)
+            setattr(self._local, name, conn)
+        return conn
+
+    # Reads
+
+    def _load(self, row) -> Any:
+        return json.loads(row[0])
+
+    def _fetch_one(self, sql: str, args: tuple, inline: bool = False):
+        return self._reader(inline).execute(sql, args).fetchone()
+
+    # Point read by primary key, on the event loop. Busy (e.g. a checkpoint): retried in the threadpool
+    async def _point_read(self, sql: str, args: tuple):
+        try:
+            return self._fetch_one(sql, args, inline=True)
+        except sqlite3.OperationalError as error:
+            if "locked" not in str(error) and "busy" not in str(error):
+                raise
+            return await run_in_threadpool(self._fetch_one, sql, args)
+
+    async def get(self, key: Any) -> Optional[Any]:
+        row = await self._point_read(f"SELECT value FROM {self.table} WHERE key = ?", (key,))
+        if row is not None:
+            return self._load(row)
+
+    # (value, version) or None
+    async def get_versioned(self, key: Any) -> Optional[Tuple[Any, int]]:
+        row = await self._point_read(f"SELECT value, version FROM {self.table} WHERE key = ?", (key,))
+        if row is not None:
+            return self._load(row), row[1]
+
+    def _get_many(self, keys: List[Any]) -> Dict[Any, Any]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._reader().execute(f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", keys)
+        return {key: json.loads(value) for key, value in rows}
+
+    async def get_many(self, keys: Iterable[Any]) -> Dict[Any, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        return await run_in_threadpool(self._get_many, keys)
+
+    def _scan(self, after: Any, limit: int) -> List[Tuple[Any, Any]]:
+        if after is None:
+            rows = self._reader().execute(f"SELECT key, value FROM {self.table} ORDER BY key LIMIT ?", (limit,))
+        else:
+            rows = self._reader().execute(f"SELECT key, value FROM {self.table} WHERE key > ? ORDER BY key LIMIT ?", (after, limit))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    # Keyset pagination: the rows after `after` in key order
+    async def scan(self, after: Any = None, limit: int = 100) -> List[Tuple[Any, Any]]:
+        return await run_in_threadpool(self._scan, after, limit)
+
+    def _scan_offset(self, skip: int, limit: int) -> List[Tuple[Any, Any]]:
+        rows = self._reader().execute(f"SELECT key, value FROM {self.table} ORDER BY key LIMIT ? OFFSET ?", (limit, skip))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    # Compatibility with skip/limit pagination, the cost grows with skip
+    async def scan_offset(self, skip: int = 0, limit: int = 100) -> List[Tuple[Any, Any]]:
+        return await run_in_threadpool(self._scan_offset, skip, limit)
+
+    # Pages shaped like pagination.SortedIndex's: (values, key to continue from, None at the end)
+    async def page_after(self, after: Any, limit: int) -> Tuple[List[Any], Optional[Any]]:
+        return self._page(await self.scan(after, limit + 1), limit)
+
+    async def offset_page(self, skip: int, limit: int) -> Tuple[List[Any], Optional[Any]]:
+        return self._page(await self.scan_offset(skip, limit + 1), limit)
+
+    def _page(self, rows: List[Tuple[Any, Any]], limit: int) -> Tuple[List[Any], Optional[Any]]:
+        next_key = rows[limit - 1][0] if 0 < limit < len(rows) else None
+        return [value for _, value in rows[:limit]], next_key
+
+    # Every row, read in batches of batch_size (each one in the threadpool): memory use doesn't depend on the table size
+    async def iterate(self, batch_size: int = 500) -> AsyncIterator[Tuple[Any, Any]]:
+        after = None
+        while True:
+            rows = await self.scan(after, batch_size)
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+    async def count(self) -> int:
+        return (await run_in_threadpool(self._fetch_one, f"SELECT COUNT(*) FROM {self.table}", ()))[0]
+
+    def _deltas(self, key: Any, after: int, limit: int) -> List[Tuple[int, Any]]:
+        rows = self._reader().execute(
+            f"SELECT version, changes FROM {self.table}_deltas WHERE key = ? AND version > ? ORDER BY version LIMIT ?",
+            (key, after, limit),
+        ).fetchall()
+        return [(version, json.loads(changes)) for version, changes in rows]
+
+    # (version, delta) of the writes after version `after`, oldest first
+    async def deltas(self, key: Any, after: int = 0, limit: int = 100) -> List[Tuple[int, Any]]:
+        return await run_in_threadpool(self._deltas, key, after, limit)
+
+    # Writes
+
+    def _submit(self, operation: str, *args) -> "asyncio.Future":
+        if self._writer is None:
+            self._open()
+        future: Future = Future()
+        self._writes.put((operation, args, future))
+        return asyncio.wrap_future(future)
+
+    # Returns the new version
+    async def put(self, key: Any, value: Any) -> int:
+        return await self._submit("put", key, json.dumps(value))
+
+    # Returns whether the key existed
+    async def delete(self, key: Any) -> bool:
+        return await self._submit("delete", key)
+
+    # Atomic check-then-write primitives, the writer thread runs each one as a single statement.
+    # Returns False when the key already existed (nothing is written)
+    async def insert_if_absent(self, key: Any, value: Any) -> bool:
+        return await self._submit("insert_if_absent", key, json.dumps(value))
+
+    # Writes only if the key is still at expected_version. Returns the new version, None if it wasn't.
+    # delta: stored with the new version, in the same transaction as the write
+    async def compare_and_set(self, key: Any, expected_version: int, value: Any, delta: Optional[Any] = None) -> Optional[int]:
+        return await self._submit("compare_and_set", key, expected_version, json.dumps(value), None if delta is None else json.dumps(delta))
+
+    def _put(self, conn: sqlite3.Connection, key: Any, value: str) -> int:
+        row = conn.execute(
+            f"INSERT INTO {self.table} (key, value, version) VALUES (?, ?, 1) "
+            f"ON CONFLICT (key) DO UPDATE SET value = excluded.value, version = version + 1 RETURNING version",
+            (key, value),
+        ).fetchone()
+        return row[0]
+
+    def _insert_if_absent(self, conn: sqlite3.Connection, key: Any, value: str) -> bool:
+        return conn.execute(f"INSERT OR IGNORE INTO {self.table} (key, value, version) VALUES (?, ?, 1)", (key, value)).rowcount > 0
+
+    def _compare_and_set(self, conn: sqlite3.Connection, key: Any, expected_version: int, value: str, delta: Optional[str]) -> Optional[int]:
+        row = conn.execute(
+            f"UPDATE {self.table} SET value = ?, version = version + 1 WHERE key = ? AND version = ? RETURNING version",
+            (value, key, expected_version),
+        ).fetchone()
+        if row is None:
+            return None
+        if delta is not None:
+            conn.execute(f"INSERT OR REPLACE INTO {self.table}_deltas (key, version, changes) VALUES (?, ?, ?)", (key, row[0], delta))
+            conn.execute(f"DELETE FROM {self.table}_deltas WHERE key = ? AND version <= ?", (key, row[0] - self.keep_deltas))
+        return row[0]
+
+    def _delete(self, conn: sqlite3.Connection, key: Any) -> bool:
+        conn.execute(f"DELETE FROM {self.table}_deltas WHERE key = ?", (key,))  # A new item with this key starts at version 1
+        return conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+
+    # The writer thread must never die: every later write would wait for it forever
+    def _write_loop(self, conn: sqlite3.Connection):
+        while True:
+            batch = [self._writes.get()]  # Wait for the first write...
+            while len(batch) < self.max_batch:  # ...and take every write that queued up meanwhile
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            closing = any(write is _CLOSE for write in batch)
+            # A write whose request was cancelled (client gone, timeout) is skipped, the others can't be cancelled any more
+            batch = [write for write in batch if write is not _CLOSE and write[2].set_running_or_notify_cancel()]
+            if batch:
+                try:
+                    results = self._commit(conn, batch)
+                except Exception as error:
+                    try:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                    except Exception:
+                        pass
+                    results = [(future, None, error) for _, _, future in batch]
+                for future, result, error in results:
+                    try:
+                        if error is None:
+                            future.set_result(result)
+                        else:
+                            future.set_exception(error)
+                    except InvalidStateError:
+                        pass
+            if closing:
+                conn.close()
+                return
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[tuple]) -> List[tuple]:
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        for operation, args, future in batch:
+            conn.execute("SAVEPOINT write")  # A failing write must not undo the others
+            try:
+                results.append((future, getattr(self, "_" + operation)(conn, *args), None))
+                conn.execute("RELEASE write")
+            except Exception as error:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                results.append((future, None, error))
+        conn.execute("COMMIT")
+        self.commits += 1
+        self.committed_writes += len(batch)
+        return results
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(_CLOSE)
+            self._writer.join()
+            self._writer = None
+        for name in ("conn", "inline_conn"):
+            conn = getattr(self._local, name, None)
+            if conn is not None:
+                conn.close()
+                setattr(self._local, name, None)
+
+    def stats(self):
+        return {
+            "commits": self.commits,
+            "committed_writes": self.committed_writes,
+            "writes_per_commit": self.committed_writes / self.commits if self.commits else 0.0,
+            "queued_writes": self._writes.qsize(),
+        }
@@ -0,0 +1,96 @@
+from typing import Any, Dict, Type
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+from pydantic.schema import schema as models_schema
+
+# Discriminated ("tagged") unions: models told apart by the value of one field, e.g. "type": "car" / "plane".
+# With Union[PlaneItem, CarItem], pydantic tries the models one after the other until one validates:
+# the cost grows with the number of models, and the first model that happens to fit wins
+# (plane data is a valid CarItem if CarItem comes first, extra fields are ignored).
+# TaggedUnion keeps a registry, field value -> model, and validates with the model the value points to:
+# one dict lookup, whatever the number of models.
+#
+#   item_types = TaggedUnion("type")
+#
+#   @item_types.register
+#   class CarItem(BaseItem):
+#       type = "car"  # The default of the field is the value registered
+#
+#   ItemType = item_types.field_type
+#   @app.get("/items/{item_id}", response_model=ItemType)    -> responses
+#   async def update_item(item: ItemType = Body(...)):       -> request bodies (Body() is needed, it's not a BaseModel)
+#   item_types.add_to_openapi(app)                           -> the models in components/schemas
+#
+# In the OpenAPI schema the union is a oneOf of $refs with a discriminator mapping each value to its model,
+# so generated clients can pick the model from the value whatever the models are called.
+
+REF_PREFIX = "#/components/schemas/"
+
+
+class TaggedUnion:
+    def __init__(self, field: str = "type"):
+        self.field = field
+        self.models: Dict[Any, Type[BaseModel]] = {}
+        self.field_type = self._make_field_type()
+
+    def register(self, model: Type[BaseModel]) -> Type[BaseModel]:
+        value = model.__fields__[self.field].default
+        if value is None:
+            raise TypeError(f"{model.__name__}.{self.field} needs a default to be registered")
+        if value in self.models:
+            raise TypeError(f"{self.field}={value!r} is already registered to {self.models[value].__name__}")
+        self.models[value] = model
+        return model
+
+    def validate(self, data: Any) -> BaseModel:
+        if isinstance(data, BaseModel):
+            if self.models.get(getattr(data, self.field, None)) is type(data):
+                return data
+            data = data.dict()
+        if not isinstance(data, dict):
+            raise TypeError("value is not a valid dict")
+        if self.field not in data:
+            raise ValueError(f"discriminator {self.field!r} is missing")
+        model = self.models.get(data[self.field])
+        if model is None:
+            raise ValueError(f"{self.field} must be one of {', '.join(map(repr, self.models))}")
+        return model.parse_obj(data)
+
+    # A type for annotations and response_model, validated by validate()
+    def _make_field_type(self) -> type:
+        union = self
+
+        class Tagged:
+            @classmethod
+            def __get_validators__(cls):
+                yield union.validate
+
+            # The models are referenced from the OpenAPI schema, add_to_openapi() puts them in its components
+            @classmethod
+            def __modify_schema__(cls, field_schema: Dict[str, Any]):
+                field_schema.update(
+                    oneOf=[{"$ref": REF_PREFIX + model.__name__} for model in union.models.values()],
+                    discriminator={
+                        "propertyName": union.field,
+                        "mapping": {str(value): REF_PREFIX + model.__name__ for value, model in union.models.items()},
+                    },
+                )
+
+        return Tagged
+
+    # The schemas of the models (and of the models they use), by name
+    def definitions(self) -> Dict[str, Any]:
+        return models_schema(list(self.models.values()), ref_prefix=REF_PREFIX)["definitions"]
+
+    # FastAPI only collects the BaseModels of the routes, it doesn't see the models behind field_type
+    def add_to_openapi(self, app: FastAPI):
+        get_openapi = app.openapi
+
+        def openapi() -> Dict[str, Any]:
+            if app.openapi_schema is None:
+                schema = get_openapi()  # Cached in app.openapi_schema
+                schema.setdefault("components", {}).setdefault("schemas", {}).update(self.definitions())
+            return app.openapi_schema
+
+        app.openapi = openapi
@@ -0,0 +1,63 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from . import float_arrays
+from .main_3 import app
+
+client = TestClient(app)
+
+OCTET_STREAM = {"content-type": float_arrays.OCTET_STREAM}
+
+
+def post_binary(weights):
+    return client.post("/index-weights/", content=float_arrays.encode(weights), headers=OCTET_STREAM)
+
+
+def test_binary_weights():
+    response = post_binary(float_arrays.Weights(np.array([3, 7]), np.array([2.5, 1.0])))
+    assert response.status_code == 200
+    assert response.json() == {"3": 2.5, "7": 1.0}
+
+
+def test_binary_response():
+    response = client.post("/index-weights/", json={"1": 2}, headers={"Accept": float_arrays.OCTET_STREAM})
+    assert response.status_code == 200
+    weights = float_arrays.decode(response.content)
+    assert weights.to_dict() == {1: 2.0}
+
+
+def test_invalid_utf8_keys():
+    body = float_arrays.HEADER.pack(float_arrays.MAGIC, 8, float_arrays.STR_KEYS, 1, 2) + np.array([1.0]).tobytes() + b"\xff\xfe"
+    response = client.post("/index-weights/", content=body, headers=OCTET_STREAM)
+    assert response.status_code == 400
+
+
+def test_string_keys_for_int_keys():
+    response = post_binary(float_arrays.Weights(["a"], np.array([1.0])))
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid weights: Expected integer keys"}
+
+
+def test_non_finite_values():
+    assert post_binary(float_arrays.Weights(None, np.array([np.nan]))).status_code == 400
+    assert post_binary(float_arrays.Weights(None, np.array([np.inf]))).status_code == 400
+    response = client.post("/index-weights/", content=b'{"1": NaN}', headers={"content-type": "application/json"})
+    assert response.status_code == 422
+
+
+def test_key_out_of_int64_range():
+    response = client.post("/index-weights/", content=b'{"99999999999999999999": 1.0}', headers={"content-type": "application/json"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "99999999999999999999", "__key__"]
+
+
+def test_float32_out_of_range():
+    response = client.post("/index-weights/?dtype=float32", json={"1": 1e300}, headers={"Accept": float_arrays.OCTET_STREAM})
+    assert response.status_code == 400
+    response = client.post("/index-weights/?dtype=float32", json={"1": 1.5}, headers={"Accept": float_arrays.OCTET_STREAM})
+    assert float_arrays.decode(response.content).to_dict() == {1: 1.5}
+
+
+def test_npy_string_keys_round_trip():
+    weights = float_arrays.Weights(["foo", "barbaz"], np.array([2.3, 3.4]))
+    assert float_arrays.decode_npy(float_arrays.encode_npy(weights)).to_dict() == {"foo": 2.3, "barbaz": 3.4}
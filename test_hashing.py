@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from .hashing import HashPool
+
+
+def test_cancelled_request_keeps_its_slot_until_the_job_is_done():
+    pool = HashPool(max_workers=1, max_queue=0)
+
+    async def scenario():
+        request = asyncio.ensure_future(pool._run(time.sleep, 0.3))
+        await asyncio.sleep(0.05)  # The job is running
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        # The worker is still busy: the slot stays taken, and the queue is full
+        assert pool.stats()["in_flight"] == 1
+        assert pool._semaphore.locked()
+        await asyncio.sleep(0.4)
+        assert pool.stats()["in_flight"] == 0
+        assert await pool._run(sum, [1, 2]) == 3
+
+    asyncio.run(scenario())
+    pool.shutdown()
+
+
+def test_verify():
+    pool = HashPool(max_workers=2)
+    pool.rounds = 4
+
+    async def scenario():
+        hashed_password = await pool.hash("secret")
+        assert await pool.verify("secret", hashed_password)
+        assert not await pool.verify("wrong", hashed_password)
+
+    asyncio.run(scenario())
+    pool.shutdown()
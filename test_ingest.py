@@ -0,0 +1,53 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from starlette.requests import Request
+
+from .ingest import StreamedIngest
+from .uploads import StreamedUploads
+
+BODY = b'--b\r\nContent-Disposition: form-data; name="files"; filename="a.txt"\r\n\r\nhello\r\n--b--\r\n'
+
+
+def new_request() -> Request:
+    async def receive():
+        return {"type": "http.request", "body": BODY, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/files/", "headers": [(b"content-type", b"multipart/form-data; boundary=b")]}
+    return Request(scope, receive)
+
+
+def test_cancelled_request_waits_for_running_steps():
+    seen = []
+
+    def slow_step(file):
+        time.sleep(0.2)
+        seen.append(os.path.exists(file.path))  # Still there while the step runs
+
+    ingest = StreamedIngest(StreamedUploads(directory=tempfile.mkdtemp()), steps=[slow_step, slow_step])
+
+    async def scenario():
+        upload = ingest(new_request())
+        request = asyncio.ensure_future(upload.__anext__())
+        await asyncio.sleep(0.05)  # The first step is running
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        assert seen == [True]  # The first step finished before the file was removed, the second never started
+
+    asyncio.run(scenario())
+    ingest.close()
+
+
+def test_ingest():
+    ingest = StreamedIngest(StreamedUploads(directory=tempfile.mkdtemp()), steps=[lambda file: {"read": file.file.read()}])
+
+    async def scenario():
+        upload = ingest(new_request())
+        form = await upload.__anext__()
+        assert [result["read"] for result in form.results] == [b"hello"]
+        await upload.aclose()
+
+    asyncio.run(scenario())
+    ingest.close()
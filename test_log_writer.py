@@ -0,0 +1,34 @@
+import os
+import tempfile
+import time
+
+from .log_writer import BatchedLogWriter
+
+
+def test_error_does_not_stop_the_writer():
+    directory = os.path.join(tempfile.mkdtemp(), "missing")
+    log_writer = BatchedLogWriter(os.path.join(directory, "log.txt"), max_queue=4)
+    log_writer.write_blocking("lost\n")
+    log_writer.flush_blocking()  # Returns although the write failed
+    assert log_writer.stats()["errors"] == 1
+    assert log_writer.stats()["dropped"] == 1
+    os.makedirs(directory)
+    for _ in range(10):  # More than max_queue
+        log_writer.write_blocking("kept\n")
+    log_writer.flush_blocking()
+    log_writer.close()
+    with open(os.path.join(directory, "log.txt")) as file:
+        assert file.read() == "kept\n" * 10
+
+
+def test_interval_fsync_of_the_tail():
+    log_writer = BatchedLogWriter(os.path.join(tempfile.mkdtemp(), "log.txt"), flush_interval=0.01, fsync_interval=0.2)
+    log_writer.write_blocking("first\n")
+    time.sleep(0.05)
+    assert log_writer.fsyncs == 1
+    log_writer.write_blocking("tail\n")  # Within fsync_interval of the first fsync, then no more traffic
+    time.sleep(0.05)
+    assert log_writer.fsyncs == 1
+    time.sleep(0.4)
+    assert log_writer.fsyncs == 2
+    log_writer.close()
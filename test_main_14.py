@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+
+# main_14 keeps its users and tokens in SQLite databases, every test run gets new ones
+_directory = tempfile.mkdtemp()
+os.environ["MAIN_14_USERS_DB"] = os.path.join(_directory, "users.db")
+os.environ["MAIN_14_TOKENS_DB"] = os.path.join(_directory, "tokens.db")
+
+from .main_14 import app
+
+client = TestClient(app)
+
+
+def login():
+    response = client.post("/token", data={"username": "johndoe", "password": "secret"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def refresh(refresh_token):
+    return client.post("/token", data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+
+
+def read_me(access_token):
+    return client.get("/users/me/", headers={"Authorization": f"Bearer {access_token}"})
+
+
+def test_login():
+    tokens = login()
+    assert tokens["token_type"] == "bearer"
+    response = read_me(tokens["access_token"])
+    assert response.status_code == 200
+    assert response.json()["username"] == "johndoe"
+
+
+def test_login_wrong_password():
+    response = client.post("/token", data={"username": "johndoe", "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_refresh_rotates():
+    tokens = login()
+    response = refresh(tokens["refresh_token"])
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    assert read_me(refreshed["access_token"]).status_code == 200
+    assert refresh(refreshed["refresh_token"]).status_code == 200
+
+
+def test_refresh_token_reuse_revokes_family():
+    tokens = login()
+    refreshed = refresh(tokens["refresh_token"]).json()
+    response = refresh(tokens["refresh_token"])
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Refresh token reuse detected"}
+    # The newest refresh token of the family is gone too
+    assert refresh(refreshed["refresh_token"]).status_code == 401
+
+
+def test_access_token_is_not_a_refresh_token():
+    tokens = login()
+    assert refresh(tokens["access_token"]).status_code == 401
+
+
+def test_logout():
+    tokens = login()
+    response = client.post("/logout", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 200
+    assert read_me(tokens["access_token"]).status_code == 401
+    # The refresh token of the same login can't mint new access tokens
+    assert refresh(tokens["refresh_token"]).status_code == 401
+
+
+def test_logout_after_refresh():
+    tokens = login()
+    refreshed = refresh(tokens["refresh_token"]).json()
+    response = client.post("/logout", headers={"Authorization": f"Bearer {refreshed['access_token']}"})
+    assert response.status_code == 200
+    assert refresh(refreshed["refresh_token"]).status_code == 401
+
+
+def test_logout_keeps_other_logins():
+    tokens = login()
+    other = login()
+    client.post("/logout", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert read_me(other["access_token"]).status_code == 200
+    assert refresh(other["refresh_token"]).status_code == 200
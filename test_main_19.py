@@ -1,5 +1,11 @@
+import os
+import tempfile
+
 from fastapi.testclient import TestClient
 
+# main_19 keeps its items in a SQLite database, every test run gets a new one
+os.environ["MAIN_19_ITEMS_DB"] = os.path.join(tempfile.mkdtemp(), "items.db")
+
 from .main_19 import app
 
 client = TestClient(app)
@@ -41,6 +47,17 @@ def test_create_item():
     }
 
 
+def test_created_item_is_stored():
+    client.post(
+        "/items/",
+        headers={"X-Token": "coneofsilence"},
+        json={"id": "stored", "title": "Stored"},
+    )
+    response = client.get("/items/stored", headers={"X-Token": "coneofsilence"})
+    assert response.status_code == 200
+    assert response.json() == {"id": "stored", "title": "Stored", "description": None}
+
+
 def test_create_item_bad_token():
     response = client.post(
         "/items/",
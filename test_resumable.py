@@ -0,0 +1,45 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+
+from .blob_store import BlobStore
+from .resumable import ResumableUploads
+
+
+def new_uploads(**limits):
+    directory = tempfile.mkdtemp()
+    return ResumableUploads(os.path.join(directory, "resumable"), BlobStore(os.path.join(directory, "blobs")), **limits)
+
+
+def test_max_sessions():
+    uploads = new_uploads(max_sessions=2)
+
+    async def scenario():
+        first = await uploads.create("a", 10)
+        await uploads.create("b", 10)
+        with pytest.raises(HTTPException) as error:
+            await uploads.create("c", 10)
+        assert error.value.status_code == 429
+        await uploads.cancel(first["id"])
+        await uploads.create("c", 10)
+
+    asyncio.run(scenario())
+    uploads.close()
+
+
+def test_max_reserved():
+    uploads = new_uploads(max_reserved=100)
+
+    async def scenario():
+        await uploads.create("a", 60)
+        with pytest.raises(HTTPException) as error:
+            await uploads.create("b", 60)
+        assert error.value.status_code == 507
+        await uploads.create("b", 40)
+        assert len([name for name in os.listdir(uploads.directory) if name.endswith(".part")]) == 2  # Nothing for the refused one
+
+    asyncio.run(scenario())
+    uploads.close()
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from .revocation import RevocationList
+
+
+def test_revoked_on_another_worker():
+    path = os.path.join(tempfile.mkdtemp(), "tokens.db")
+    worker_a = RevocationList(path, capacity=1000)
+    worker_b = RevocationList(path, capacity=1000)
+
+    async def scenario():
+        # Both filters are loaded, the next compaction is a minute away
+        assert not await worker_a.is_revoked("j1")
+        assert not await worker_b.is_revoked("j1")
+        await worker_a.revoke("j1", time.time() + 60)
+        assert await worker_b.is_revoked("j1")
+        assert await worker_a.is_revoked("j1")
+        assert not await worker_b.is_revoked("j2")
+        assert worker_b.stats()["catch_ups"] == 1
+
+    asyncio.run(scenario())
+    worker_a.close()
+    worker_b.close()
+
+
+def test_compaction_drops_expired():
+    revocation_list = RevocationList(os.path.join(tempfile.mkdtemp(), "tokens.db"), capacity=1000)
+
+    async def scenario():
+        await revocation_list.revoke("expired", time.time() - 1)
+        await revocation_list.revoke("valid", time.time() + 60)
+        await revocation_list.compact()
+        assert revocation_list.bloom.count == 1
+        assert not await revocation_list.is_revoked("expired")
+        assert await revocation_list.is_revoked("valid")
+
+    asyncio.run(scenario())
+    revocation_list.close()
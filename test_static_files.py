@@ -0,0 +1,19 @@
+import asyncio
+import os
+import tempfile
+
+from .static_files import CachedStaticFiles
+
+
+def test_concurrent_misses_are_counted_once():
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, "app.js"), "w") as file:
+        file.write("console.log('hello');\n" * 100)
+    static = CachedStaticFiles(directory=directory)
+
+    async def scenario():
+        entries = await asyncio.gather(*(static._lookup("app.js") for _ in range(5)))
+        assert len(static._files) == 1
+        assert static._cache_bytes == entries[-1].cost
+
+    asyncio.run(scenario())
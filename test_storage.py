@@ -0,0 +1,58 @@
+import asyncio
+import os
+import tempfile
+
+from .storage import SQLiteItemStore
+
+
+def new_store():
+    return SQLiteItemStore(os.path.join(tempfile.mkdtemp(), "items.db"), initial={"foo": {"name": "Foo"}})
+
+
+def test_cancelled_write_does_not_stop_the_writer():
+    store = new_store()
+
+    async def scenario():
+        await store.count()  # Opened, the writer thread is running
+        write = asyncio.ensure_future(store.put("cancelled", 1))
+        await asyncio.sleep(0)  # Queued for the writer
+        write.cancel()
+        try:
+            await write
+        except asyncio.CancelledError:
+            pass
+        assert await asyncio.wait_for(store.put("after", 2), timeout=5) == 1
+        assert await store.get("after") == 2
+
+    asyncio.run(scenario())
+    store.close()
+
+
+def test_reads():
+    store = new_store()
+
+    async def scenario():
+        await store.put("bar", {"name": "Bar"})
+        assert await store.get("foo") == {"name": "Foo"}
+        assert await store.get_versioned("bar") == ({"name": "Bar"}, 1)
+        assert await store.get_many(["foo", "baz"]) == {"foo": {"name": "Foo"}}
+        assert await store.scan_offset(1, 10) == [("foo", {"name": "Foo"})]
+        assert await store.count() == 2
+        assert [key async for key, _ in store.iterate(batch_size=1)] == ["bar", "foo"]
+
+    asyncio.run(scenario())
+    store.close()
+
+
+def test_compare_and_set_records_the_delta():
+    store = new_store()
+
+    async def scenario():
+        assert await store.compare_and_set("foo", 1, {"name": "Foo", "price": 3}, delta={"price": 3}) == 2
+        assert await store.compare_and_set("foo", 1, {"name": "Lost"}, delta={"name": "Lost"}) is None
+        assert await store.deltas("foo") == [(2, {"price": 3})]
+        await store.delete("foo")
+        assert await store.deltas("foo") == []
+
+    asyncio.run(scenario())
+    store.close()
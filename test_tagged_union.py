@@ -0,0 +1,48 @@
+from fastapi import Body, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from .tagged_union import TaggedUnion
+
+item_types = TaggedUnion("type")
+
+
+@item_types.register
+class CarItem(BaseModel):
+    type = "car"
+
+
+@item_types.register
+class PlaneItem(BaseModel):
+    type = "plane"
+    size: int
+
+
+ItemType = item_types.field_type
+
+app = FastAPI()
+item_types.add_to_openapi(app)
+
+
+@app.put("/items/", response_model=ItemType)
+async def update_item(item: ItemType = Body(...)):
+    return item
+
+
+client = TestClient(app)
+
+
+def test_validates_with_the_tagged_model():
+    response = client.put("/items/", json={"type": "plane", "size": 5})
+    assert response.json() == {"type": "plane", "size": 5}
+    assert client.put("/items/", json={"type": "boat"}).status_code == 422
+
+
+def test_openapi_discriminator_mapping():
+    schema = client.get("/openapi.json").json()
+    body = schema["paths"]["/items/"]["put"]["requestBody"]["content"]["application/json"]["schema"]
+    assert body["discriminator"] == {
+        "propertyName": "type",
+        "mapping": {"car": "#/components/schemas/CarItem", "plane": "#/components/schemas/PlaneItem"},
+    }
+    assert {"CarItem", "PlaneItem"} <= set(schema["components"]["schemas"])
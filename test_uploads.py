@@ -0,0 +1,56 @@
+import tempfile
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from .uploads import StreamedForm, StreamedUploads
+
+app = FastAPI()
+streamed_upload = StreamedUploads(directory=tempfile.mkdtemp())
+
+
+@app.post("/file/")
+async def create_file(form: StreamedForm = Depends(streamed_upload)):
+    file = form.get_file("file")
+    return {"size": file.size, "sha256": file.sha256, "content": file.file.read().decode()}
+
+
+client = TestClient(app)
+
+HEADERS = {"content-type": "multipart/form-data; boundary=b"}
+PART = b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\n'
+
+
+def test_upload():
+    response = client.post("/file/", content=PART + b"hello\r\n--b--\r\n", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json() == {
+        "size": 5,
+        "sha256": "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+        "content": "hello",
+    }
+
+
+def test_truncated_upload():
+    response = client.post("/file/", content=PART + b"hel", headers=HEADERS)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Incomplete multipart body"}
+
+
+def test_malformed_upload():
+    response = client.post("/file/", content=b"garbage", headers=HEADERS)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Malformed multipart body"}
+
+
+def test_non_utf8_filename():
+    body = b'--b\r\nContent-Disposition: form-data; name="file"; filename="\xff\xfe.txt"\r\n\r\nhello\r\n--b--\r\n'
+    response = client.post("/file/", content=body, headers=HEADERS)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Malformed multipart body"}
+
+
+def test_non_utf8_field_value():
+    body = PART + b'hello\r\n--b\r\nContent-Disposition: form-data; name="note"\r\n\r\n\xff\xfe\r\n--b--\r\n'
+    response = client.post("/file/", content=body, headers=HEADERS)
+    assert response.status_code == 400
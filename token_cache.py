@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+
+# Cache of already verified tokens.
+# Verifying a JWT means checking its signature, looking the user up and building a model,
+# so once a token has been verified we keep the resolved user around until the token's "exp".
+# Entries are keyed by a digest of the token, so the raw bearer tokens are never kept in memory.
+# The cache is bounded: when it is full the least recently used entry is dropped (LRU).
+
+
+class CachedToken(NamedTuple):
+    user: Any
+    expires_at: float
+    jti: Optional[str] = None  # Still needed on a cache hit, to check whether the token was revoked
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenCache:
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()  # digest -> (username, CachedToken)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[CachedToken]:
+        key = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached = entry[1]
+            if cached.expires_at <= time.time():
+                # The token has expired, a cached user must not outlive it
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    # expires_at is a unix timestamp, i.e. the "exp" claim of the token
+    def put(self, token: str, user: Any, expires_at: float, jti: Optional[str] = None, username: Optional[str] = None):
+        if expires_at <= time.time():
+            return
+        if username is None:
+            username = user.username
+        key = token_digest(token)
+        with self._lock:
+            self._entries[key] = (username, CachedToken(user, expires_at, jti))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._entries.pop(token_digest(token), None)
+
+    # Invalidation hook: call it whenever a user changes (e.g. gets disabled),
+    # so every cached token of that user has to be verified again.
+    def invalidate_user(self, username: str):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[0] == username]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,78 @@
+import functools
+import inspect
+from typing import Any, Callable, Dict, Mapping, Optional, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+# Trusted responses: skip the response_model validation for data that was validated on its way in.
+# For every response FastAPI validates what the endpoint returned against response_model, builds a model,
+# turns it back into a dict and runs jsonable_encoder over it, even when it just read a dict from the store
+# that was validated (and encoded) by the request that wrote it.
+# @trusted_response(Item) turns the returned dict straight into the JSON response with a field plan
+# compiled once from the model: which keys to output, under which name, and the JSON default of the missing ones.
+# Only use it where every stored value went through the model, nothing is checked.
+#
+#   @app.get("/items/{item_id}", response_model=Item, response_model_exclude_unset=True)  # response_model: for the docs
+#   @trusted_response(Item, exclude_unset=True)                                          # same exclude_unset as the route
+#   async def read_item(item_id: str): ...
+#
+# Returning a Response works as usual, a BaseModel is encoded the usual way (it isn't a stored dict).
+
+_REQUIRED = object()
+
+
+class ResponsePlan:
+    def __init__(self, model: Type[BaseModel], exclude_unset: bool = False, by_alias: bool = True):
+        self.model = model
+        self.exclude_unset = exclude_unset
+        self.by_alias = by_alias
+        # (key in the stored dict, key in the response, JSON default or _REQUIRED)
+        self.fields = tuple(
+            (name, field.alias if by_alias else name, _REQUIRED if field.required else jsonable_encoder(field.get_default()))
+            for name, field in model.__fields__.items()
+        )
+
+    def render(self, data: Mapping[str, Any]) -> Dict[str, Any]:
+        if self.exclude_unset:
+            return {output: data[name] for name, output, _ in self.fields if name in data}
+        content = {}
+        for name, output, default in self.fields:
+            value = data.get(name, default)
+            if value is _REQUIRED:
+                raise KeyError(f"{self.model.__name__}.{name} is missing from the stored data")
+            content[output] = value
+        return content
+
+
+def trusted_response(model: Type[BaseModel], exclude_unset: bool = False, by_alias: bool = True, status_code: int = 200) -> Callable:
+    plan = ResponsePlan(model, exclude_unset=exclude_unset, by_alias=by_alias)
+
+    def decorator(endpoint: Callable) -> Callable:
+        # The endpoint's Response parameter, if any: headers set on it are copied to the JSON response
+        response_param: Optional[str] = next(
+            (name for name, param in inspect.signature(endpoint).parameters.items() if param.annotation is Response), None
+        )
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+            if isinstance(result, BaseModel):
+                content = jsonable_encoder(result, by_alias=by_alias, exclude_unset=exclude_unset)
+            else:
+                content = plan.render(result)
+            response = JSONResponse(content, status_code=status_code)
+            sub_response = kwargs.get(response_param) if response_param else None
+            if sub_response is not None:
+                if sub_response.status_code:
+                    response.status_code = sub_response.status_code
+                response.raw_headers.extend((key, value) for key, value in sub_response.headers.raw if key != b"content-length")
+            return response
+
+        wrapper.response_plan = plan
+        return wrapper
+
+    return decorator
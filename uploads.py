@@ -0,0 +1,239 @@
+import hashlib
+import os
+import tempfile
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Streaming multipart uploads.
+# File(...) parameters read the whole form before the endpoint runs: bytes keeps every file in memory,
+# UploadFile spools it to disk, but only after 1 MB, and nothing is checked until the upload is complete.
+# StreamedUploads reads the request body as it arrives and writes every file part to a temporary file:
+# - memory use is the chunk being parsed plus flush_size of pending data, whatever the file size
+# - the SHA-256 and the size of every file are computed on the way, no second pass over the file
+# - Content-Length is checked before reading anything, the request and file sizes while reading:
+#   an upload over the limit is rejected with 413 as soon as it crosses it
+# - a body that ends before the closing boundary (truncated or malformed) is rejected with 400,
+#   no file of it gets to the endpoint
+# The endpoint gets a StreamedForm: form fields, and files with an open handle at position 0.
+# It's a dependency with yield: the temporary files are removed after the response,
+# unless the endpoint took them over with StreamedFile.detach().
+#
+#   streamed_upload = StreamedUploads(max_file_size=...)
+#   @app.post("/file/")
+#   async def create_file(form: StreamedForm = Depends(streamed_upload)): ...
+
+
+class StreamedFile:
+    # hash=False: sha256 stays None, e.g. when it's computed later (see ingest.py)
+    def __init__(self, field: str, filename: str, content_type: Optional[str], directory: Optional[str] = None, hash: bool = True):
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        fd, self.path = tempfile.mkstemp(prefix="upload-", dir=directory)
+        self.file = os.fdopen(fd, "w+b")
+        self.size = 0
+        self.sha256: Optional[str] = None  # Hex digest, set once the part is complete
+        self._hash = hashlib.sha256() if hash else None
+        self.received = 0  # Bytes parsed, some of them may not be written yet
+
+    # Blocking, called in the threadpool
+    def write(self, data: bytes):
+        self.file.write(data)
+        if self._hash is not None:
+            self._hash.update(data)
+        self.size += len(data)
+
+    def finish(self):
+        self.file.flush()
+        self.file.seek(0)
+        if self._hash is not None:
+            self.sha256 = self._hash.hexdigest()
+
+    # The caller owns the file at the returned path from now on (e.g. to move it with os.replace)
+    def detach(self) -> str:
+        self.file.close()
+        path, self.path = self.path, None
+        return path
+
+    def close(self):
+        self.file.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+class StreamedForm:
+    def __init__(self):
+        self.fields: Dict[str, List[str]] = {}
+        self.files: Dict[str, List[StreamedFile]] = {}
+
+    def get_file(self, name: str) -> StreamedFile:
+        if not self.files.get(name):
+            raise HTTPException(status_code=422, detail=[{"loc": ["body", name], "msg": "field required", "type": "value_error.missing"}])
+        return self.files[name][0]
+
+    def get_field(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.fields.get(name)
+        return values[0] if values else default
+
+    def all_files(self) -> List[StreamedFile]:
+        return [file for files in self.files.values() for file in files]
+
+    def close(self):
+        for file in self.all_files():
+            file.close()
+
+
+class StreamedUploads:
+    def __init__(
+        self,
+        max_file_size: int = 100 * 1024 * 1024,
+        max_request_size: Optional[int] = None,
+        max_files: int = 100,
+        max_field_size: int = 64 * 1024,
+        flush_size: int = 1024 * 1024,
+        directory: Optional[str] = None,
+        hash: bool = True,
+    ):
+        self.max_file_size = max_file_size
+        self.max_request_size = max_request_size
+        self.max_files = max_files
+        self.max_field_size = max_field_size
+        self.flush_size = flush_size
+        self.directory = directory  # None: the system's temporary directory
+        self.hash = hash
+
+    async def __call__(self, request: Request) -> AsyncIterator[StreamedForm]:
+        form = StreamedForm()
+        try:
+            await self.parse(request, form)
+            yield form
+        finally:
+            form.close()
+
+    # on_file is called with every file once the whole body has arrived and ended with the closing boundary
+    async def parse(self, request: Request, form: StreamedForm, on_file: Optional[Callable[[StreamedFile], Any]] = None):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+        content_length = request.headers.get("content-length")
+        if self.max_request_size is not None and content_length and content_length.isdigit() and int(content_length) > self.max_request_size:
+            raise HTTPException(status_code=413, detail="Request too large")
+
+        pending: List[Tuple[StreamedFile, bytes]] = []  # Parsed file data, not written yet
+        finished: List[StreamedFile] = []
+        complete: List[StreamedFile] = []  # Written and finished, handed to on_file at the end
+        pending_size = 0
+        ended = False
+        part: Dict[str, Any] = {}
+
+        def on_part_begin():
+            part.clear()
+            part.update(headers=[], field=b"", value=b"", file=None, data=bytearray())
+
+        def on_header_field(data: bytes, start: int, end: int):
+            part["field"] += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int):
+            part["value"] += data[start:end]
+
+        def on_header_end():
+            part["headers"].append((part["field"].lower(), part["value"]))
+            part["field"], part["value"] = b"", b""
+
+        def on_headers_finished():
+            headers = dict(part["headers"])
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            part["name"] = options.get(b"name", b"").decode()
+            if b"filename" in options:
+                if len(form.all_files()) >= self.max_files:
+                    raise HTTPException(status_code=413, detail="Too many files")
+                content_type = headers.get(b"content-type")
+                file = StreamedFile(part["name"], options[b"filename"].decode(), content_type.decode() if content_type else None, self.directory, self.hash)
+                form.files.setdefault(part["name"], []).append(file)
+                part["file"] = file
+
+        def on_part_data(data: bytes, start: int, end: int):
+            nonlocal pending_size
+            file = part["file"]
+            if file is None:
+                part["data"] += data[start:end]
+                if len(part["data"]) > self.max_field_size:
+                    raise HTTPException(status_code=413, detail=f"Field {part['name']} too large")
+                return
+            file.received += end - start
+            if file.received > self.max_file_size:
+                raise HTTPException(status_code=413, detail=f"File {file.filename} too large")
+            pending.append((file, data[start:end]))
+            pending_size += end - start
+
+        def on_part_end():
+            if part["file"] is None:
+                form.fields.setdefault(part["name"], []).append(part["data"].decode())
+            else:
+                finished.append(part["file"])
+
+        def on_end():
+            nonlocal ended
+            ended = True
+
+        def flush(writes: List[Tuple[StreamedFile, bytes]], ended: List[StreamedFile]):
+            for file, data in writes:
+                file.write(data)
+            for file in ended:
+                file.finish()
+
+        callbacks = {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_end": on_end,
+        }
+        parser = MultipartParser(params[b"boundary"], callbacks)
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if self.max_request_size is not None and received > self.max_request_size:
+                raise HTTPException(status_code=413, detail="Request too large")
+            try:
+                parser.write(chunk)
+            except (MultipartParseError, UnicodeDecodeError):  # Also a name, filename or field value that isn't UTF-8
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+            # Disk writes and hashing run in the threadpool, in batches of flush_size so the hops stay cheap
+            if pending_size >= self.flush_size or finished:
+                await run_in_threadpool(flush, pending[:], finished[:])
+                complete.extend(finished)
+                pending.clear()
+                finished.clear()
+                pending_size = 0
+        parser.finalize()
+        if not ended:
+            # The body stopped before the closing boundary: the last file was never finished
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        if pending or finished:
+            await run_in_threadpool(flush, pending, finished)
+            complete.extend(finished)
+        if on_file is not None:
+            for file in complete:
+                on_file(file)
+
+
+# OpenAPI description of a multipart body read by StreamedUploads (the endpoint has no File/Form parameters)
+# files/fields: name -> required, multiple: the file fields take several files
+def openapi_body(files: Dict[str, bool], fields: Optional[Dict[str, bool]] = None, multiple: bool = False) -> Dict[str, Any]:
+    file_schema = {"type": "string", "format": "binary"}
+    properties = {name: {"type": "array", "items": file_schema} if multiple else file_schema for name in files}
+    properties.update({name: {"type": "string"} for name in fields or {}})
+    required = [name for name, is_required in {**files, **(fields or {})}.items() if is_required]
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {"type": "object", "properties": properties, "required": required}}}}}
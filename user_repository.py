@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from sqlite_pool import SQLitePool
+
+# Where users are stored, behind one small async interface:
+# - get(username) returns the user as a `model` instance, or None
+# - save(user) creates or replaces a user
+# - update(username, **fields) changes some fields of a user
+# InMemoryUserRepository keeps the users in a dict (like fake_users_db),
+# SQLiteUserRepository keeps them in a SQLite database so only the users we look up are loaded,
+# and CachedUserRepository puts a read-through cache with a TTL in front of any of them.
+
+
+class UserRepository(ABC):
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+
+    @abstractmethod
+    async def get(self, username: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def save(self, user: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def update(self, username: str, **fields) -> bool:
+        ...
+
+
+class InMemoryUserRepository(UserRepository):
+    def __init__(self, model: Type[BaseModel], users: Dict[str, Dict[str, Any]]):
+        super().__init__(model)
+        self.users = users
+
+    async def get(self, username: str) -> Optional[Any]:
+        if username in self.users:
+            return self.model(**self.users[username])
+
+    async def save(self, user: Dict[str, Any]):
+        self.users[user["username"]] = dict(user)
+
+    async def update(self, username: str, **fields) -> bool:
+        if username not in self.users:
+            return False
+        self.users[username].update(fields)
+        return True
+
+
+class SQLiteUserRepository(UserRepository):
+    # initial: users to insert when the database is created, e.g. fake_users_db
+    def __init__(self, model: Type[BaseModel], path: str, pool_size: int = 4, initial: Optional[Dict[str, Dict[str, Any]]] = None):
+        super().__init__(model)
+        self.initial = initial or {}
+        self.pool = SQLitePool(path, size=pool_size, init=self._create_schema)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID")
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)",
+            [(username, json.dumps(user)) for username, user in self.initial.items()],
+        )
+
+    @staticmethod
+    def _get(conn: sqlite3.Connection, username: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+    @staticmethod
+    def _save(conn: sqlite3.Connection, user: Dict[str, Any]):
+        conn.execute("INSERT OR REPLACE INTO users (username, data) VALUES (?, ?)", (user["username"], json.dumps(user)))
+
+    @staticmethod
+    def _update(conn: sqlite3.Connection, username: str, fields: Dict[str, Any]) -> bool:
+        conn.execute("BEGIN IMMEDIATE")  # Read-modify-write, so take the write lock before reading
+        try:
+            user = SQLiteUserRepository._get(conn, username)
+            if user is not None:
+                user.update(fields)
+                SQLiteUserRepository._save(conn, user)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return user is not None
+
+    async def get(self, username: str) -> Optional[Any]:
+        user = await self.pool.run(self._get, username)
+        if user is not None:
+            return self.model(**user)
+
+    async def save(self, user: Dict[str, Any]):
+        await self.pool.run(self._save, dict(user))
+
+    async def update(self, username: str, **fields) -> bool:
+        return await self.pool.run(self._update, username, fields)
+
+
+class CachedUserRepository(UserRepository):
+    def __init__(self, repository: UserRepository, ttl: float = 60, maxsize: int = 10_000):
+        super().__init__(repository.model)
+        self.repository = repository
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # username -> (expires_at, user)
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    async def get(self, username: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            invalidations = self._invalidations
+        user = await self.repository.get(username)
+        if user is not None:
+            with self._lock:
+                if invalidations != self._invalidations:
+                    return user  # A write happened while we were loading, this user may be stale already
+                self._entries[username] = (time.monotonic() + self.ttl, user)
+                self._entries.move_to_end(username)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return user
+
+    async def save(self, user: Dict[str, Any]):
+        await self.repository.save(user)
+        self.invalidate(user["username"])
+
+    async def update(self, username: str, **fields) -> bool:
+        updated = await self.repository.update(username, **fields)
+        self.invalidate(username)
+        return updated
+
+    # Call it when a user was changed behind the cache's back
+    def invalidate(self, username: str):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(username, None)
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}